@@ -0,0 +1,219 @@
+# benchmark.py module contents
+#   - synthetic shallow profiler data from synthetic.py
+#   - benchmarks of the chapter module hot paths with run time and peak (traced) memory
+#   - machine-readable results: one JSON record per measurement appended to a results file
+#
+# Run the suite from the chapters folder: python benchmark.py [results filename]
+
+import os, sys, time, glob, warnings
+import io, json, platform, subprocess, tempfile, contextlib
+import tracemalloc
+import numpy as np, pandas as pd, xarray as xr
+from numpy import datetime64 as dt64, timedelta64 as td64
+
+import data
+import shallowprofiler as sp
+from synthetic import SyntheticDataset, SyntheticSpkirDataset
+
+warnings.filterwarnings('ignore')
+
+
+def SyntheticDepthSeries(n_days, t0 = '2022-01-01', seed = 0):
+    '''
+    Return (z, t): n_days of synthetic.SyntheticDataset() depth (negative down) at 1Min per sample,
+    as ProfileGenerator() expects, and its times.
+    '''
+    ds = SyntheticDataset([], t0, dt64(t0, 'D') + n_days, 1./60, seed=seed)
+    return ds['depth'].values, ds['time'].values
+
+
+def BenchmarkProfileDetection(day_counts = (30, 90, 180), verbose = True):
+    '''
+    Time the per-sample loop ProfileEventsLoop() against the vectorized ProfileEvents() on
+    synthetic depth series spanning day_counts days; confirm identical event lists.
+    Returns a list of (n_days, loop seconds, vectorized seconds, match).
+    '''
+    results = []
+    for n_days in day_counts:
+        z, t = SyntheticDepthSeries(n_days)
+        tic = time.perf_counter(); loop_events = data.ProfileEventsLoop(z, t); toc_loop = time.perf_counter() - tic
+        tic = time.perf_counter(); vec_events  = data.ProfileEvents(z, t);     toc_vec  = time.perf_counter() - tic
+        match = loop_events == vec_events
+        results.append((n_days, toc_loop, toc_vec, match))
+        if verbose: print(str(n_days) + ' days: loop ' + '{:.3f}'.format(toc_loop) + 's, vectorized ' + \
+                          '{:.4f}'.format(toc_vec) + 's, speedup ' + '{:.0f}'.format(toc_loop/toc_vec) + \
+                          'x, events match: ' + str(match))
+    return results
+
+
+def Measure(f, *args):
+    '''Return (result, seconds, peak traced memory in MB) for the call f(*args)'''
+    tracemalloc.start()
+    tic = time.perf_counter()
+    result = f(*args)
+    toc = time.perf_counter() - tic
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, toc, peak
+
+
+def BenchmarkTimeNormalization(sizes = (10**5, 10**6, 4*10**6), n_vars = 6, verbose = True):
+    '''
+    Compare the original ReformatDataFile() time handling (DataFrame round-trip sort, sel() window, 
+    np.unique de-duplication) with data.NormalizeTime() on synthetic Datasets of n_vars variables
+    whose time dimension is slightly out of order and has duplicated records. Returns a list of
+    (size, old seconds, old peak MB, new seconds, new peak MB, match).
+    '''
+    def old_path(ds, t0, t1):
+        ds = data.SortTimeDataFrame(ds).sel(time=slice(t0, t1))
+        _, keeper_index = np.unique(ds['time'], return_index=True)
+        return ds.isel(time=keeper_index)
+
+    results = []
+    rng = np.random.default_rng(0)
+    for n in sizes:
+        rows = np.arange(n)
+        rows = np.concatenate((rows, rows[rng.integers(0, n, n // 100)]))            # duplicated records
+        swap = rng.integers(0, len(rows) - 1, n // 100)
+        rows[swap], rows[swap + 1] = rows[swap + 1], rows[swap]                      # slightly out of order
+        t  = dt64('2021-04-01', 'ns') + (rows * 1e9).astype('timedelta64[ns]')
+        ds = xr.Dataset({'v' + str(k): ('time', rng.normal(size=n)[rows]) for k in range(n_vars)}, coords={'time': t})
+        t0, t1 = t.min() + td64(1, 'h'), t.max() - td64(1, 'h')
+        old, old_s, old_mb = Measure(old_path, ds, t0, t1)
+        new, new_s, new_mb = Measure(lambda ds, t0, t1: data.NormalizeTime(ds, t0, t1).load(), ds, t0, t1)
+        match = old.identical(new)
+        results.append((n, old_s, old_mb, new_s, new_mb, match))
+        if verbose: print(str(n) + ' samples: DataFrame path ' + '{:.3f}'.format(old_s) + 's ' + '{:.0f}'.format(old_mb) + \
+                          'MB, NormalizeTime ' + '{:.3f}'.format(new_s) + 's ' + '{:.0f}'.format(new_mb) + 'MB, match: ' + str(match))
+    return results
+
+
+def Quiet(f, *args):
+    '''Call f(*args) with its printed progress output discarded'''
+    with contextlib.redirect_stdout(io.StringIO()): return f(*args)
+
+
+def BenchmarkRecord(benchmark, n_days, n_samples, seconds, peak_mb, **extra):
+    '''One benchmark measurement as a dictionary (one line of the results file)'''
+    return {'benchmark': benchmark, 'n_days': n_days, 'n_samples': int(n_samples), 
+            'seconds': round(seconds, 6), 'peak_mb': round(peak_mb, 3), **extra}
+
+
+def BenchmarkSuite(day_counts = (2, 7, 31), rate = 1., bundle_size = 90, query_calls = 100, verbose = True):
+    '''
+    Time the chapter module hot paths on synthetic data of n_days for each of day_counts: Depth at
+    one sample per minute (as ProfileGenerator() expects); sensors and spkir at rate samples per 
+    second. Files are written to a temporary folder and removed afterwards. Returns a list of 
+    BenchmarkRecord() dictionaries with run time and peak traced memory (Measure()):
+
+      ProfileGenerator               profile detection from a depth file
+      ProfileWriter                  CSV profile metadata write ...
+      ReadProfileMetadata            ... and read (the same for the NetCDF metadata path, '_nc')
+      GenerateTimeWindowIndices      query_calls midnight window queries (with a ProfileIndex)
+      GetSensorTuple                 open a sensor file and load its sensor and depth values
+      BundleChart                    bundle_size profile bundle chart, drawn (Agg)
+      ReformatSpkirData              seven channel spkir split into per-channel files
+    '''
+    import charts
+    from matplotlib import pyplot as plt
+
+    records = []
+    def record(name, n_days, n_samples, measured, **extra):
+        records.append(BenchmarkRecord(name, n_days, n_samples, measured[1], measured[2], **extra))
+        if verbose: print(name.ljust(28) + str(n_days).rjust(4) + ' days ' + str(int(n_samples)).rjust(10) + ' samples ' + \
+                          '{:9.4f}'.format(measured[1]) + 's ' + '{:8.1f}'.format(measured[2]) + 'MB')
+        return measured[0]
+
+    for n_days in day_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            z, t = SyntheticDepthSeries(n_days)
+            depthfnm = os.path.join(tmp, 'depth.nc')
+            xr.Dataset({'z': ('time', z)}, coords={'time': t}).to_netcdf(depthfnm)
+
+            events = record('ProfileGenerator', n_days, len(z), Measure(Quiet, data.ProfileGenerator, depthfnm, 'z'))
+            a0, a1, d0, d1, r0, r1 = [e[:min(len(x) for x in events)] for e in events]    # complete profiles only
+            csvfnm, ncfnm = os.path.join(tmp, 'profiles.csv'), os.path.join(tmp, 'profiles.nc')
+            record('ProfileWriter', n_days, len(a0), Measure(Quiet, data.ProfileWriter, csvfnm, a0, a1, d0, d1, r0, r1))
+            profiles = record('ReadProfileMetadata', n_days, len(a0), Measure(sp.ReadProfileMetadata, csvfnm))
+            record('ProfileWriter_nc', n_days, len(a0), Measure(data.ProfileMetadataWriter, ncfnm, a0, a1, d0, d1, r0, r1))
+            record('ReadProfileMetadata_nc', n_days, len(a0), Measure(sp.ReadProfileMetadata, ncfnm))
+
+            date0, date1 = dt64(profiles['a0t'].min().floor('D')), dt64(profiles['a0t'].max().floor('D'))
+            pindex = sp.ProfileIndex(profiles)
+            def queries():
+                for k in range(query_calls): 
+                    pidcs = sp.GenerateTimeWindowIndices(profiles, date0, date1, *sp.midnight_window, pindex=pindex)
+                return pidcs
+            record('GenerateTimeWindowIndices', n_days, len(profiles), Measure(queries), calls=query_calls)
+
+            sensorfnm = os.path.join(tmp, 'temp.nc')
+            SyntheticDataset(['temp'], t[0], dt64(t[0], 'D') + n_days, rate).to_netcdf(sensorfnm)
+            def sensor_tuple():
+                tpl = sp.GetSensorTuple('temp', sensorfnm)
+                tpl[0].load(), tpl[1].load()
+                return tpl
+            tpl = record('GetSensorTuple', n_days, n_days*86400*rate, Measure(sensor_tuple), rate=rate)
+
+            last = dt64(profiles['a0t'].iloc[min(bundle_size, len(profiles)) - 1].floor('D'))
+            def bundle():
+                ax = charts.BundleChart(profiles, date0, last, td64(0, 'h'), td64(24, 'h'), 8, 6, tpl, 'Temperature')
+                ax.figure.canvas.draw()
+                plt.close(ax.figure)
+            record('BundleChart', n_days, n_days*86400*rate, Measure(bundle), rate=rate, 
+                   profiles=len(sp.GenerateTimeWindowIndices(profiles, date0, last, td64(0, 'h'), td64(24, 'h'))))
+            tpl[0].close()
+
+            spkir = SyntheticSpkirDataset(t[0], dt64(t[0], 'D') + n_days, rate)
+            record('ReformatSpkirData', n_days, spkir.sizes['time'], 
+                   Measure(sp.ReformatSpkirData, spkir, os.path.join(tmp, 'spkir_')), rate=rate)
+    return records
+
+
+def BenchmarkImports(modules = ('timeutil', 'data', 'shallowprofiler', 'synthetic', 'ragged', 'charts'), repeats = 3, verbose = True):
+    '''
+    Cold import time of each chapter module: A fresh interpreter per import (best of repeats).
+    Records also list which plotting / widget packages the import loaded ('loaded'): The core 
+    modules (timeutil, data, shallowprofiler, synthetic, ragged) should load none of them.
+    '''
+    probe = "import sys, time; tic = time.perf_counter(); import {}; toc = time.perf_counter() - tic; " + \
+            "print(toc); print(','.join(m for m in ('matplotlib', 'IPython', 'ipywidgets', 'traitlets') if m in sys.modules))"
+    folder  = os.path.dirname(os.path.abspath(__file__))
+    records = []
+    for m in modules:
+        runs = [subprocess.run([sys.executable, '-c', probe.format(m)], capture_output=True, text=True, cwd=folder).stdout.split('\n') \
+                for k in range(repeats)]
+        seconds = min(float(r[0]) for r in runs)
+        records.append(BenchmarkRecord('import_' + m, 0, 0, seconds, 0., loaded=runs[0][1]))
+        if verbose: print(('import ' + m).ljust(28) + '{:9.4f}'.format(seconds) + 's  ' + runs[0][1])
+    return records
+
+
+def BenchmarkEnvironment():
+    '''Run context stored with every results record: time, git commit, platform and package versions'''
+    try:    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, 
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception: commit = ''
+    return {'run_utc': str(dt64('now', 's')), 'commit': commit, 'machine': platform.node(), 
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__, 'xarray': xr.__version__}
+
+
+def WriteBenchmarkResults(records, fnm = 'benchmark_results.jsonl'):
+    '''Append records (BenchmarkRecord() dictionaries) to JSON lines file fnm with BenchmarkEnvironment()'''
+    env = BenchmarkEnvironment()
+    with open(fnm, 'a') as f:
+        for r in records: f.write(json.dumps({**env, **r}) + '\n')
+    return fnm
+
+
+def ReadBenchmarkResults(fnm = 'benchmark_results.jsonl'):
+    '''Load a results file as a DataFrame: e.g. pivot on commit to compare runs'''
+    return pd.read_json(fnm, lines=True)
+
+
+if __name__ == '__main__':
+    import matplotlib
+    matplotlib.use('Agg')
+    results_fnm = sys.argv[1] if len(sys.argv) > 1 else 'benchmark_results.jsonl'
+    WriteBenchmarkResults(BenchmarkImports() + BenchmarkSuite(), results_fnm)
+    BenchmarkProfileDetection()
+    BenchmarkTimeNormalization()
@@ -1,19 +1,21 @@
 import os, sys, time, glob, warnings
+import io, threading
 from os.path import join as joindir
-from IPython.display import clear_output
 from matplotlib import pyplot as plt
 from matplotlib import colors as mplcolors
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import numpy as np, pandas as pd, xarray as xr
 from numpy import datetime64 as dt64, timedelta64 as td64
-from ipywidgets import interact, widgets
-from traitlets import dlink
 
 from shallowprofiler import *
+from lod import LODSelect, LODSelectRange, LODForFile, AxesPixelWidth
+from ragged import RaggedGather
+from timeutil import TimeOfDay
+from data import DayIndexForFile
 
 warnings.filterwarnings('ignore')
 
-def doy(theDatetime): return 1 + int((theDatetime - dt64(str(theDatetime)[0:4] + '-01-01')) / td64(1, 'D'))
-def dt64_from_doy(year, doy): return dt64(str(year) + '-01-01') + td64(doy-1, 'D')
 def day_of_month_to_string(d): return str(d) if d > 9 else '0' + str(d)
 
 
@@ -21,11 +23,15 @@ def RenderShallowProfilerTwoDayDepthChart():
     '''
     This is a very hardcoded function that generates a two-day span of profiles with some
     annotations indicating what is going on, particularly with midnight / noon profiles.
+    Depth is drawn from a min/max decimation pyramid (lod.py) with one bucket per pixel of the
+    plot area (width x height), not per column: The samples are drawn as single-pixel markers,
+    which fill a column's min..max span only if the samples in between are kept.
     '''
     t0, t1, fnm = '2022-01-01', '2022-01-03', './data/rca/sensors/osb/conductivity_jan_2022.nc'
-    ds          = xr.open_dataset(fnm).sel(time=slice(dt64(t0), dt64(t1)))
     fig, axs    = plt.subplots(figsize=(12,4), tight_layout=True)
-    axs.plot(ds.time, -ds.depth, marker=',', ms=36., color='k', mfc='r', linewidth='.001')
+    pixels      = AxesPixelWidth(axs) * int(axs.get_window_extent().height)
+    t, depth    = LODSelect(LODForFile(fnm, 'depth'), dt64(t0), dt64(t1), pixels)
+    axs.plot(t, -depth, marker=',', ms=36., color='k', mfc='r', linewidth='.001')
     axs.set(ylim = (-210., 0.), title='Shallow profiler depth over two days', ylabel='depth (m)', xlabel='Hours (UTM)')
     axs.text(dt64('2021-12-31 22:15'), -184, 'AT')
     axs.text(dt64('2021-12-31 22:05'), -193, 'REST')
@@ -42,23 +48,28 @@ def VisualizeProfiles(date_id, n_days, year_id, month_id, month_name, site_name,
     '''
     Plot profiles similar to ProfilerDepthChart: One day per row, supports many days, 
     wider and simpler layout. This is a backup diagnostic tool for looking at longer 
-    time intervals. 
+    time intervals. Each day is drawn at the row's pixel resolution from a min/max decimation 
+    pyramid of z (lod.py); built once per file, so high-rate data plot as fast as 1Min data.
+    Rows are sliced by the file's per-day sample offsets (data.DayIndexForFile()): no time searches.
     '''
-    ds = xr.open_dataset('./data/rca/sensors/' + site_abbrev + '/' + datafnm)
+    fnm = './data/rca/sensors/' + site_abbrev + '/' + datafnm
+    pyramid = LODForFile(fnm, 'z')
+    starts, offsets = DayIndexForFile(fnm)
     fig, axs = plt.subplots(n_days, 1, figsize=(15,n_days), tight_layout=True)
+    pixels = AxesPixelWidth(axs[0])
+    k0 = int((dt64(year_id + '-' + month_id, 'D') - dt64(starts[0], 'D')) / td64(1, 'D')) if len(starts) else 0
     for i in range(n_days):
-        daystring = str(i+1) if i > 8 else '0' + str(i+1)
-        time0 = dt64(year_id + '-' + month_id + '-' + daystring + 'T00:00:00')
-        time1 = dt64(year_id + '-' + month_id + '-' + daystring + 'T23:59:59')
-        dsDay = ds.sel(time=slice(time0, time1))
-        axs[i].plot(dsDay.time, dsDay.z, marker='.', markersize=3., color='k')
+        k = k0 + i                                                           # row i: day i + 1 of the month
+        lo, hi = (offsets[k], offsets[k + 1]) if 0 <= k < len(starts) else (0, 0)
+        tDay, zDay = LODSelectRange(pyramid, lo, hi, pixels)
+        axs[i].plot(tDay, zDay, marker='.', markersize=3., color='k')
         axs[i].set(ylim = (-200., 0.))
     print('...' + month_name + ' ' + str(year_id) + ' ' + site_name + ' daily profiles...')
     return True
 
 
 
-def ChartSensor(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, wid, hgt, z0=-200., z1=0.):
+def ChartSensor(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, wid, hgt, z0=-200., z1=0., cache=None):
     """
     Make a stack of charts with one horizontal axis versus y-depth.
     The data are in DataArrays A and Az. 
@@ -76,6 +87,7 @@ def ChartSensor(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, wid, hgt, z0=-200., z
     wid      width for two charts
     hgt      height for one chart (scaled by number of charts)
     z0, z1   depth range
+    cache    optional ProfileSegmentCache(p) to reuse profile segments across calls
     """
     
     # empirical values for the day's two longer-duration profiles
@@ -89,6 +101,7 @@ def ChartSensor(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, wid, hgt, z0=-200., z
     if ncharts > 100: ncharts = 100
     do_one = True if ncharts == 1 else False
     print("Attempting", ncharts, "charts\n")
+    if cache is None: cache = ProfileSegmentCache(p)
 
     # ncharts x 1: charts in a vertical column
     fig, axs = plt.subplots(ncharts, 1, figsize=(wid, hgt*ncharts), tight_layout=True)
@@ -97,9 +110,8 @@ def ChartSensor(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, wid, hgt, z0=-200., z
     #   We are interested in the time columns to constrain data selection.
     #   These correspond to which "leg" is stipulated: rest, ascent or descent.
     #   Given these are versus-depth charts: the rest option doesn't make much sense.
-    if   Aleg == 'rest':   keyA = ('r0t', 'r1t')
-    elif Aleg == 'ascent': keyA = ('a0t', 'a1t')
-    else:                  keyA = ('d0t', 'd1t')
+    if Aleg not in profile_phases: Aleg = 'descent'
+    keyA = profile_phases[Aleg]
 
   
     # The subsequent code is 'loop over charts: plot each chart: A'
@@ -110,8 +122,8 @@ def ChartSensor(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, wid, hgt, z0=-200., z
         
         pidx = pidcs[i]
 
-        tA0, tA1 = p[keyA[0]][pidx], p[keyA[1]][pidx]
-        Ax, Ay = A.sel(time=slice(tA0,  tA1)), Az.sel(time=slice(tA0, tA1))
+        tA0 = p[keyA[0]][pidx]
+        Ax, Ay = ProfileSegment(cache, A, Az, pidx, Aleg)
         
         if do_one: axs.plot(    Ax, Ay, ms = 4., color=Acolor, mfc=Acolor)
         else:      axs[i].plot( Ax, Ay, ms = 4., color=Acolor, mfc=Acolor)
@@ -127,7 +139,7 @@ def ChartSensor(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, wid, hgt, z0=-200., z
 
         # chart time label
         profile_start_time = 'Start UTC: ' + str(tA0)
-        delta_t = tA0-dt64(tA0.date())
+        delta_t = TimeOfDay(tA0)
         if delta_t > midn0 and delta_t < midn1: profile_start_time += " MIDNIGHT local"
         if delta_t > noon0 and delta_t < noon1: profile_start_time += " NOON local"
         xlabel = xrng[0] + 0.2*(xrng[1] - xrng[0])
@@ -144,7 +156,7 @@ def ChartOneSensor(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, wid, hgt, z0=-200.
 
 def ChartTwoSensors(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, \
                                     B, Bz, Blbl, Bcolor, Bleg, \
-                                    wid, hgt, z0=-200., z1=0.):
+                                    wid, hgt, z0=-200., z1=0., cache=None):
     """
     Make a stack of charts with two horizontal axes to compare two sensors A and B.
     The data are in DataArrays: A, Az, B, Bz. pidcs are row indices for the profile
@@ -161,6 +173,7 @@ def ChartTwoSensors(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, \
     wid      width for two charts
     hgt      height for one chart (scaled by number of charts)
     z0, z1   depth range
+    cache    optional ProfileSegmentCache(p) to reuse profile segments across calls
     """
     
     # empirical values for the day's two longer-duration profiles
@@ -175,6 +188,7 @@ def ChartTwoSensors(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, \
     do_one = True if ncharts == 1 else False
     chart_case = 'chart' if do_one else 'charts'
     print("Attempting", ncharts, chart_case, "\n")
+    if cache is None: cache = ProfileSegmentCache(p)
 
     # ncharts x 1: charts in a vertical column
     fig, axs = plt.subplots(ncharts, 1, figsize=(wid, hgt*ncharts), tight_layout=True)
@@ -184,12 +198,9 @@ def ChartTwoSensors(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, \
 
     # profile table p has column headers 'a0z', 'a0t' and so on for r and d
     #   We are interested in the time columns to constrain data selection
-    if   Aleg == 'rest':   keyA = ('r0t', 'r1t')
-    elif Aleg == 'ascent': keyA = ('a0t', 'a1t')
-    else:                  keyA = ('d0t', 'd1t')
-    if   Bleg == 'rest':   keyB = ('r0t', 'r1t')
-    elif Bleg == 'ascent': keyB = ('a0t', 'a1t')
-    else:                  keyB = ('d0t', 'd1t')
+    if Aleg not in profile_phases: Aleg = 'descent'
+    if Bleg not in profile_phases: Bleg = 'descent'
+    keyA = profile_phases[Aleg]
   
     # The subsequent code is 'loop over charts: plot each chart, A and B'
     # For this we need both a profile index into the profile dataframe p (from the
@@ -199,11 +210,10 @@ def ChartTwoSensors(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, \
         
         pidx = pidcs[i]
 
-        tA0, tA1 = p[keyA[0]][pidx], p[keyA[1]][pidx]
-        tB0, tB1 = p[keyB[0]][pidx], p[keyB[1]][pidx]
+        tA0 = p[keyA[0]][pidx]
         
-        Ax, Ay = A.sel(time=slice(tA0,  tA1)), Az.sel(time=slice(tA0, tA1))
-        Bx, By = B.sel(time=slice(tB0,  tB1)), Bz.sel(time=slice(tB0, tB1))
+        Ax, Ay = ProfileSegment(cache, A, Az, pidx, Aleg)
+        Bx, By = ProfileSegment(cache, B, Bz, pidx, Bleg)
         
         if do_one:
             axs.plot(    Ax, Ay, ms = 4., color=Acolor, mfc=Acolor)
@@ -231,7 +241,7 @@ def ChartTwoSensors(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, \
 
         # chart time label
         ascent_start_time = 'Start UTC: ' + str(tA0)
-        delta_t = tA0-dt64(tA0.date())
+        delta_t = TimeOfDay(tA0)
         if delta_t > midn0 and delta_t < midn1: ascent_start_time += " MIDNIGHT local"
         if delta_t > noon0 and delta_t < noon1: ascent_start_time += " NOON local"
         xlabel = xrng[0][0] + 0.2*(xrng[0][1] - xrng[0][0])
@@ -243,7 +253,36 @@ def ChartTwoSensors(p, xrng, pidcs, A, Az, Albl, Acolor, Aleg, \
 
 
 
-def BundleChart(profiles, date0, date1, time0, time1, wid, hgt, data, title):
+def ProfileBundle(cache, A, Az, pidcs, phase = 'ascent', skip = 0):
+    '''
+    Return (x, z): The samples of every profile in pidcs (profile table rows) as one NaN-separated
+    polyline so that a whole bundle is a single Line2D artist. cache is a ProfileSegmentCache(); 
+    skip drops that many leading samples from each profile (see BundleInteract()).
+    '''
+    entry, (i0, i1) = ProfileSegmentOffsets(cache, A, Az, phase)
+    rows   = cache['rows'].get_indexer(pidcs)
+    starts = i0[rows] + skip
+    counts = np.maximum(i1[rows] - starts, 0)
+    gather = RaggedGather(starts, counts)
+    breaks = np.cumsum(counts)[:-1]
+    x = np.insert(entry['values'][gather].astype(float), breaks, np.nan)
+    z = np.insert(entry['depths'][gather].astype(float), breaks, np.nan)
+    return x, z
+
+
+def BundleLine(ax, x, z, color, line = None):
+    '''
+    Draw a ProfileBundle() polyline on ax; or, given the line from a previous call, swap its data
+    in place (no new artist). Returns the line.
+    '''
+    if line is None: line, = ax.plot(x, z, ms = 4., color=color, mfc=color)
+    else:
+        line.set_data(x, z)
+        line.set_color(color)
+    return line
+
+
+def BundleChart(profiles, date0, date1, time0, time1, wid, hgt, data, title, pindex = None, cache = None):
     '''
     Create a bundle chart: Multiple profiles showing sensor/depth in ensemble.
         date0   start / end of time range: date only, range is inclusive [date0, date1]
@@ -254,14 +293,16 @@ def BundleChart(profiles, date0, date1, time0, time1, wid, hgt, data, title):
         hgt
         data    a value from the data dictionary (5-tuple: includes range and color)
         title   chart title
+        pindex  optional ProfileIndex(profiles): build once when making many charts
+        cache   optional ProfileSegmentCache(profiles): likewise
         
     profiles is a global DataFrame
     '''
-    pidcs = GenerateTimeWindowIndices(profiles, date0, date1, time0, time1) # each index contributes a thread to the bundle
+    pidcs = GenerateTimeWindowIndices(profiles, date0, date1, time0, time1, pindex) # each index contributes a thread to the bundle
+    if cache is None: cache = ProfileSegmentCache(profiles)
     fig, ax = plt.subplots(figsize=(wid, hgt), tight_layout=True)
-    for i in range(len(pidcs)):
-        ta0, ta1 = profiles["a0t"][pidcs[i]], profiles["a1t"][pidcs[i]]          # [ta0, ta1] is this thread's time range (ascent)
-        ax.plot(data[0].sel(time=slice(ta0,  ta1)), data[1].sel(time=slice(ta0, ta1)), ms = 4., color=data[4], mfc=data[4])
+    x, z = ProfileBundle(cache, data[0], data[1], pidcs, 'ascent')       # all threads' ascent samples
+    BundleLine(ax, x, z, data[4])
     ax.set(title = title)
     ax.set(xlim = (data[2], data[3]), ylim = (-200, 0))
     return ax
@@ -269,11 +310,12 @@ def BundleChart(profiles, date0, date1, time0, time1, wid, hgt, data, title):
 
 def ShowStaticBundles(d, profiles):
     '''creates bundle charts for Jan 2022, Oregon Slope Base'''
-    BundleChart(profiles, dt64('2022-01-01'), dt64('2022-02-01'), td64(0, 'h'), td64(24, 'h'), 8, 6, d['do'], 'Dissolved Oxygen')
-    BundleChart(profiles, dt64('2022-01-01'), dt64('2022-02-01'), td64(0, 'h'), td64(24, 'h'), 8, 6, d['temp'], 'Temperature')
-    BundleChart(profiles, dt64('2022-01-01'), dt64('2022-02-01'), td64(0, 'h'), td64(24, 'h'), 8, 6, d['density'], 'Density')
-    BundleChart(profiles, dt64('2022-01-01'), dt64('2022-02-01'), td64(0, 'h'), td64(24, 'h'), 8, 6, d['salinity'], 'Salinity')
-    BundleChart(profiles, dt64('2022-01-01'), dt64('2022-02-01'), td64(0, 'h'), td64(24, 'h'), 8, 6, d['chlora'], 'Chlorophyll A Fluorescence')
+    pindex, cache = ProfileIndex(profiles), ProfileSegmentCache(profiles)
+    BundleChart(profiles, dt64('2022-01-01'), dt64('2022-02-01'), td64(0, 'h'), td64(24, 'h'), 8, 6, d['do'], 'Dissolved Oxygen', pindex, cache)
+    BundleChart(profiles, dt64('2022-01-01'), dt64('2022-02-01'), td64(0, 'h'), td64(24, 'h'), 8, 6, d['temp'], 'Temperature', pindex, cache)
+    BundleChart(profiles, dt64('2022-01-01'), dt64('2022-02-01'), td64(0, 'h'), td64(24, 'h'), 8, 6, d['density'], 'Density', pindex, cache)
+    BundleChart(profiles, dt64('2022-01-01'), dt64('2022-02-01'), td64(0, 'h'), td64(24, 'h'), 8, 6, d['salinity'], 'Salinity', pindex, cache)
+    BundleChart(profiles, dt64('2022-01-01'), dt64('2022-02-01'), td64(0, 'h'), td64(24, 'h'), 8, 6, d['chlora'], 'Chlorophyll A Fluorescence', pindex, cache)
     # These last two are not terribly illuminating
     # BundleChart(profiles, dt64('2022-01-01'), dt64('2022-02-01'), td64(0, 'h'), td64(24, 'h'), 8, 6, d['fdom'], 'FDOM')
     # BundleChart(profiles, dt64('2022-01-01'), dt64('2022-02-01'), td64(0, 'h'), td64(24, 'h'), 8, 6, d['bb'], 'Particulate Backscatter')
@@ -282,7 +324,7 @@ def ShowStaticBundles(d, profiles):
 
 
 
-def BundleInteract(d, profiles, sensor_key, time_index, bundle_size):
+def BundleInteract(d, profiles, sensor_key, time_index, bundle_size, pindex = None, cache = None):
     '''
     Consider a time range that includes many (e.g. 279) consecutive profiles. This function plots sensor data
     within the time range. Choose the sensor using a dropdown. Choose the first profile using the start slider.
@@ -295,10 +337,13 @@ def BundleInteract(d, profiles, sensor_key, time_index, bundle_size):
           - ph and pco2 still have a charting bug "last-to-first line" clutter: For some reason
             the first profile value is the last value from the prior profile. There is a hack in
             place ("i0") to deal with this.
+      - pindex is an optional ProfileIndex(profiles) built once by the caller (BundleInteractor)
+      - cache is likewise an optional ProfileSegmentCache(profiles): slider moves become lookups
+      - the bundle is drawn as one NaN-separated line (ProfileBundle()) rather than a line per profile
     '''
     
 
-    (phase0, phase1, i0) = ('a0t', 'a1t', 0) if not (sensor_key == 'ph' or sensor_key == 'pco2') else ('d0t', 'd1t', 1)
+    (phase, i0) = SensorPhase(sensor_key)
     
     # print('  type(data):', type(data))
     # print('  data[0]:', data[0])
@@ -328,17 +373,16 @@ def BundleInteract(d, profiles, sensor_key, time_index, bundle_size):
     x0, x1, z0, z1 = xlo, xhi, -200, 0
     title          = xtitle
     color          = xcolor
-    pidcs          = GenerateTimeWindowIndices(profiles, date0, date1, time0, time1)    # !!!!! either midn or noon, not both
+    pidcs          = GenerateTimeWindowIndices(profiles, date0, date1, time0, time1, pindex)    # !!!!! either midn or noon, not both
     nProfiles      = len(pidcs)
     
+    if cache is None: cache = ProfileSegmentCache(profiles)
+    
     fig, ax = plt.subplots(figsize=(wid, hgt), tight_layout=True)
     iProf0 = time_index if time_index < nProfiles else nProfiles
     iProf1 = iProf0 + bundle_size if iProf0 + bundle_size < nProfiles else nProfiles
-    for i in range(iProf0, iProf1):
-        pIdx = pidcs[i]
-        ta0, ta1 = profiles[phase0][pIdx], profiles[phase1][pIdx]
-        xi, zi = x.sel(time=slice(ta0,  ta1)), z.sel(time=slice(ta0, ta1))
-        ax.plot(xi[i0:], zi[i0:], ms = 4., color=color, mfc=color)
+    xb, zb = ProfileBundle(cache, x, z, pidcs[iProf0:iProf1], phase, i0)
+    BundleLine(ax, xb, zb, color)
     ax.set(title = title)
     ax.set(xlim = (x0, x1), ylim = (z0, z1))
 
@@ -351,34 +395,108 @@ def BundleInteract(d, profiles, sensor_key, time_index, bundle_size):
     return
 
 
-def BundleInteractor(d, profiles, continuous_update = False):
-    '''Set up three bundle-interactive charts, vertically. Independent sliders for choice of 
-    sensor, starting profile by index, and number of profiles in bundle. (90 profiles is about
-    ten days.) A fast machine can have cu = True to give a slider-responsive animation. Make
-    it False to avoid jerky 'takes forever' animation on less powerful machines.
-    '''
-    style = {'description_width': 'initial'}
-    
-    # data dictionary d{} keys:
-    optionsList = ['temperature', 'salinity', 'density', 'conductivity', 'do', 'chlora', 'fdom', 'bb', 'pco2', 'ph', 'par', 'nitrate']
-    
-    print('type(d):', type(d))
-    print('len(d):', len(d))
-    print('d["conductivity"]: is ok')
-    print()
-    print()
-    print()
-
-    interact(BundleInteract, d = [d],             \
-                             profiles = profiles, \
-                             sensor_key = widgets.Dropdown(options=optionsList,  value=optionsList[0], description='sensor'), \
-                             time_index = widgets.IntSlider(min=0, max=270, step=1, value=160,                    \
-                                                            layout=widgets.Layout(width='35%'),                   \
-                                                            continuous_update=False, description='bundle start',  \
-                                                            style=style),
-                             bundle_size = widgets.IntSlider(min=1, max=90, step=1, value=20,                     \
-                                                            layout=widgets.Layout(width='35%'),                   \
-                                                            continuous_update=False, description='bundle width',  \
-                                                            style=style))
+# sensors offered by the bundle viewer (descent_sensors are charted on descent: SensorPhase())
+bundle_sensors = ['temperature', 'salinity', 'density', 'conductivity', 'do', 'chlora', 'fdom', 'bb', 'pco2', 'ph', 'par', 'nitrate']
 
-    return
+
+class BundleViewer:
+    '''
+    Interactive bundle chart that keeps its state: The profile index, segment cache, figure and
+    bundle line are built once; widget events only swap the line data. Slider input is debounced:
+    a redraw waits debounce seconds and is superseded by any newer event in that time. The chart
+    is rendered (Agg) into an ipywidgets Image so no plotting backend setup is needed.
+
+    d           data dictionary: sensor key > sensor tuple (GetSensorTuple()) or a SensorRegistry
+    profiles    profile metadata DataFrame
+    date0, date1, time0, time1     the profile time window as in GenerateTimeWindowIndices()
+
+    Display the viewer (last line of a cell or display(viewer)). viewer.selection(key) lists the
+    profiles with data for sensor key: The 'bundle start' slider runs over this list. Lists are 
+    made on first selection of a sensor so that only the sensors charted are read (d may be a
+    SensorRegistry).
+    '''
+    def __init__(self, d, profiles, date0 = dt64('2022-01-01'), date1 = dt64('2022-02-01'), 
+                 time0 = td64(0, 'h'), time1 = td64(24, 'h'), sensors = None, wid = 9, hgt = 6, 
+                 continuous_update = True, debounce = 0.05):
+        from ipywidgets import widgets                          # widget layer: loaded on first use
+        if sensors is None: sensors = [s for s in bundle_sensors if s in d]
+        self.d, self.profiles, self.debounce = d, profiles, debounce
+        self.pindex = ProfileIndex(profiles)
+        self.cache  = ProfileSegmentCache(profiles, max_sensors = max(8, len(sensors)))
+        self.pidcs  = GenerateTimeWindowIndices(profiles, date0, date1, time0, time1, self.pindex)
+        self.selectable = {}                                    # sensor > profile list, see selection()
+
+        self.fig   = Figure(figsize=(wid, hgt), tight_layout=True)
+        FigureCanvasAgg(self.fig)
+        self.ax    = self.fig.subplots()
+        self.line  = None
+        self.timer = None
+        self.lock  = threading.Lock()
+
+        style = {'description_width': 'initial'}
+        self.sensor = widgets.Dropdown(options=sensors, value=sensors[0], description='sensor')
+        self.start  = widgets.IntSlider(min=0, max=0, step=1, value=0, layout=widgets.Layout(width='35%'),
+                                        continuous_update=continuous_update, description='bundle start', style=style)
+        self.size   = widgets.IntSlider(min=1, max=90, step=1, value=20, layout=widgets.Layout(width='35%'),
+                                        continuous_update=continuous_update, description='bundle width', style=style)
+        self.image  = widgets.Image(format='png')
+        self.limit()
+        for w in (self.sensor, self.start, self.size): w.observe(self.changed, names='value')
+        self.widget = widgets.VBox([self.sensor, self.start, self.size, self.image])
+        self.render()
+
+    def _repr_mimebundle_(self, **kwargs): return self.widget._repr_mimebundle_(**kwargs)
+
+    def profile_list(self, s, pidcs):
+        '''Profiles (rows in pidcs) that have at least two samples of sensor s in its chart phase'''
+        phase, skip = SensorPhase(s)
+        _, (i0, i1) = ProfileSegmentOffsets(self.cache, self.d[s][0], self.d[s][1], phase)
+        rows = self.cache['rows'].get_indexer(pidcs)
+        return list(np.asarray(pidcs)[i1[rows] - i0[rows] >= skip + 2])
+
+    def selection(self, s):
+        '''The profile list of sensor s: made by profile_list() on first request'''
+        if s not in self.selectable: self.selectable[s] = self.profile_list(s, self.pidcs)
+        return self.selectable[s]
+
+    def limit(self):
+        '''Fit the bundle start slider to the current sensor's profile list'''
+        n = len(self.selection(self.sensor.value))
+        self.start.max = max(n - 1, 0)
+
+    def changed(self, change):
+        if change['owner'] is self.sensor: self.limit()
+        if self.timer is not None: self.timer.cancel()
+        if not self.debounce: return self.render()
+        self.timer = threading.Timer(self.debounce, self.render)
+        self.timer.start()
+
+    def render(self):
+        '''Swap in the bundle for the current widget values and refresh the image'''
+        with self.lock:
+            s, i, n = self.sensor.value, self.start.value, self.size.value
+            A, Az, lo, hi, color = self.d[s]
+            phase, skip = SensorPhase(s)
+            pidcs = self.selection(s)[i:i + n]
+            x, z  = ProfileBundle(self.cache, A, Az, pidcs, phase, skip)
+            self.line = BundleLine(self.ax, x, z, color, self.line)
+            title = sensor_names.get(s, s)
+            if len(pidcs): title += ': ' + str(self.profiles[profile_phases[phase][0]][pidcs[0]])[:16] + \
+                                    ' to ' + str(self.profiles[profile_phases[phase][0]][pidcs[-1]])[:16]
+            self.ax.set(title = title, xlim = (lo, hi), ylim = (-200, 0))
+            buf = io.BytesIO()
+            self.fig.savefig(buf, format='png')
+            self.fig.set_layout_engine('none')                 # layout once: later redraws keep it
+            self.image.value = buf.getvalue()
+
+
+def BundleInteractor(d, profiles, continuous_update = True):
+    '''Set up the bundle-interactive chart: a BundleViewer with a dropdown for the choice of sensor
+    and sliders for the starting profile (by index) and the number of profiles in the bundle. (90
+    profiles is about ten days.) The figure is built once and slider moves only swap line data so
+    continuous_update = True gives a slider-responsive animation. Returns the viewer.
+    '''
+    from IPython.display import display
+    viewer = BundleViewer(d, profiles, continuous_update = continuous_update)
+    display(viewer)
+    return viewer
@@ -0,0 +1,114 @@
+# climatology.py module contents
+#   - depth binning: ragged profile arrays onto a fixed depth grid (profile x depth)
+#   - climatologies (mean / standard deviation profiles) by month and by noon / midnight
+#   - anomaly curtains relative to a climatology
+#
+# Gridded results are xarray Datasets with dimensions (profile, depth) that can be written to
+#   NetCDF and re-used without touching the source sensor files again.
+
+import os, sys, time, glob, warnings
+import numpy as np, pandas as pd, xarray as xr
+from numpy import datetime64 as dt64, timedelta64 as td64
+
+from shallowprofiler import ranges, noon_window, midnight_window, SensorPhase
+from ragged import RaggedProfiles, RaggedProfileIds
+from timeutil import TimeOfDay, MonthIndex
+
+warnings.filterwarnings('ignore')
+
+def DepthBinProfiles(rag, z0 = -200., z1 = 0., dz = 1., key = None):
+    '''
+    Bin every profile of ragged profile array rag onto the depth grid [z0, z1) with bin size dz
+    in one vectorized pass (np.bincount over profile x depth cells). NaN samples are ignored.
+    Returns a Dataset with variables key (bin mean) and key + '_count' on dims (profile, depth)
+    where depth is the bin center. Empty bins are NaN. key defaults to the ragged array sensor.
+    '''
+    if key is None: key = rag.attrs['sensor']
+    nbins  = int(round((z1 - z0)/dz))
+    n      = rag.sizes['profile']
+    v      = rag[key].values.astype(float)
+    bins   = np.floor((rag['depth'].values - z0)/dz).astype(np.int64)
+    pid    = RaggedProfileIds(rag)
+    keep   = np.isfinite(v) & (bins >= 0) & (bins < nbins)
+    cell   = pid[keep]*nbins + bins[keep]
+    count  = np.bincount(cell, minlength=n*nbins).reshape(n, nbins)
+    total  = np.bincount(cell, weights=v[keep], minlength=n*nbins).reshape(n, nbins)
+    with np.errstate(invalid='ignore', divide='ignore'): mean = total / count
+
+    depth = z0 + dz*(np.arange(nbins) + 0.5)
+    return xr.Dataset({key:            (('profile', 'depth'), mean, rag[key].attrs),
+                       key + '_count': (('profile', 'depth'), count)},
+                      coords={'profile': rag['profile_index'].values, 'depth': depth,
+                              'profile_time': ('profile', rag['profile_time'].values)})
+
+
+def DayNight(times):
+    '''
+    Label datetime64 array times (profile start, UTC) as 'midnight', 'noon' or 'other' using
+    the shallowprofiler noon_window and midnight_window time of day ranges.
+    '''
+    tod   = np.asarray(TimeOfDay(times))
+    label = np.full(len(tod), 'other', dtype=object)
+    label[(tod >= midnight_window[0]) & (tod <= midnight_window[1])] = 'midnight'
+    label[(tod >= noon_window[0]) & (tod <= noon_window[1])] = 'noon'
+    return label
+
+
+def SensorGrid(profiles, data, z0 = -200., z1 = 0., dz = 1., pidcs = None):
+    '''
+    Build one gridded Dataset (profile, depth) for many sensors. data is a data dictionary of
+    sensor key > sensor tuple (GetSensorTuple()); keys not in shallowprofiler.ranges are skipped.
+    Each sensor uses its ascent (descent for ph and pco2: SensorPhase()). Profile coordinates:
+    'profile' (the profile metadata row), 'profile_time' (ascent start), 'month' and 'daynight'
+    (DayNight()).
+    '''
+    if pidcs is None: pidcs = profiles.index.values
+    grids = []
+    for key, sensor in data.items():
+        if key not in ranges: continue
+        phase = SensorPhase(key)[0]
+        rag   = RaggedProfiles(profiles, sensor[0], sensor[1], (phase,), pidcs)
+        grid  = DepthBinProfiles(rag, z0, z1, dz)
+        grids.append(grid.rename({rag.attrs['sensor']: key, rag.attrs['sensor'] + '_count': key + '_count'}) \
+                         .drop_vars('profile_time'))
+
+    ds = xr.merge(grids) if len(grids) else xr.Dataset()
+    a0t = profiles.loc[pidcs, 'a0t'].values.astype('datetime64[ns]')
+    ds  = ds.assign_coords(profile_time=('profile', a0t), month=('profile', MonthIndex(a0t) + 1),
+                           daynight=('profile', DayNight(a0t).astype(str)))
+    ds.attrs['depth_bin_size'] = dz
+    return ds
+
+
+def Climatology(grid, by = 'month'):
+    '''
+    Aggregate a SensorGrid() (or DepthBinProfiles()) Dataset over profiles grouped by 'month' or
+    'daynight' (or None for all profiles together). For each sensor key the result has key +
+    '_mean', key + '_std' and key + '_n' (number of contributing profiles) on dims (by, depth).
+    '''
+    keys = [k for k in grid.data_vars if not k.endswith('_count')]
+    g    = grid[keys].groupby(by) if by is not None else grid[keys]
+    mean, std, n = g.mean('profile'), g.std('profile'), g.count('profile')
+    out = xr.Dataset()
+    for k in keys:
+        out[k + '_mean'], out[k + '_std'], out[k + '_n'] = mean[k], std[k], n[k]
+    return out
+
+
+def Anomaly(grid, climatology, by = 'month'):
+    '''
+    Anomaly curtains: Subtract the matching Climatology() mean from every profile of the grid.
+    Returns a Dataset on dims (profile, depth) with one anomaly variable per sensor key.
+    '''
+    keys = [k for k in grid.data_vars if not k.endswith('_count')]
+    out  = xr.Dataset()
+    for k in keys:
+        mean = climatology[k + '_mean']
+        out[k] = grid[k] - (mean.sel({by: grid[by]}) if by is not None else mean)
+    return out
+
+
+def WriteSensorGrid(grid, fnm):
+    '''Save a gridded Dataset (SensorGrid(), Climatology() or Anomaly()) as NetCDF for re-use.'''
+    grid.to_netcdf(fnm)
+    return True
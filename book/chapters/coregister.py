@@ -0,0 +1,149 @@
+# coregister.py module contents
+#   - time co-registration: sensors sampled at different rates aligned onto one common time base
+#   - nearest sample, linear interpolation or bin mean, each within a tolerance
+#   - chunk by chunk over month-long inputs; optional NetCDF cache of the aligned product
+#
+# Every method is vectorized with np.searchsorted over the sorted source times; a chunk of the base
+#   loads only the source samples it needs. The aligned product is an xarray Dataset on dimension
+#   'time' (the base) with one variable per sensor, ready for joint analysis: T-S diagrams, oxygen
+#   against density, chlorophyll against PAR and so on.
+
+import os, sys, time, glob, warnings
+import numpy as np, pandas as pd, xarray as xr
+from numpy import datetime64 as dt64, timedelta64 as td64
+
+from data import WriteAtomic
+
+warnings.filterwarnings('ignore')
+
+coregister_methods = ['nearest', 'linear', 'mean']
+
+
+def AlignTimes(ts, v, tb, method = 'nearest', tolerance = td64(1, 's')):
+    '''
+    Align source values v at sorted datetime64 times ts onto times tb. Result has the length of tb;
+    NaN where no source sample qualifies:
+      nearest   the closest sample, if no more than tolerance away (ties go to the earlier sample)
+      linear    interpolation between the bracketing samples, if they are no more than tolerance apart
+      mean      mean of the (finite) samples in [tb - tolerance/2, tb + tolerance/2)
+    '''
+    ts  = np.asarray(ts, dtype='datetime64[ns]')
+    tb  = np.asarray(tb, dtype='datetime64[ns]')
+    v   = np.asarray(v, dtype=float)
+    tol = td64(tolerance, 'ns')
+    out = np.full(len(tb), np.nan)
+    if not len(ts) or not len(tb): return out
+
+    if method == 'mean':
+        finite = np.isfinite(v)
+        count  = np.concatenate(([0], np.cumsum(finite)))
+        total  = np.concatenate(([0.], np.cumsum(np.where(finite, v, 0.))))
+        lo = np.searchsorted(ts, tb - tol//2, side='left')
+        hi = np.searchsorted(ts, tb + (tol - tol//2), side='left')
+        n  = count[hi] - count[lo]
+        with np.errstate(invalid='ignore', divide='ignore'): out = np.where(n > 0, (total[hi] - total[lo]) / n, np.nan)
+        return out
+
+    j     = np.searchsorted(ts, tb, side='left')
+    left  = np.clip(j - 1, 0, len(ts) - 1)
+    right = np.clip(j, 0, len(ts) - 1)
+    if method == 'nearest':
+        dl = np.abs(tb - ts[left])
+        dr = np.abs(ts[right] - tb)
+        k  = np.where(dr < dl, right, left)
+        ok = np.abs(ts[k] - tb) <= tol
+        out[ok] = v[k[ok]]
+        return out
+
+    if method == 'linear':
+        exact = (j < len(ts)) & (ts[right] == tb)
+        inner = (j > 0) & (j < len(ts)) & (ts[right] - ts[left] <= tol)
+        t0    = ts[0]
+        x     = (ts - t0) / td64(1, 'ns')
+        out[inner] = np.interp((tb[inner] - t0) / td64(1, 'ns'), x, v)
+        out[exact] = v[right[exact]]
+        return out
+
+    raise ValueError('method must be one of ' + str(coregister_methods))
+
+
+def TimeBase(sensors, base, t0 = None, t1 = None):
+    '''
+    The common time base for Coregister(): base is a datetime64 array (used as given), a sensor
+    name in sensors (that sensor's own times) or a timedelta64 step (a regular grid across the time
+    range all sensors share, from a whole multiple of step). Restricted to [t0, t1] if given.
+    '''
+    if isinstance(base, str): tb = np.asarray(sensors[base]['time'].values, dtype='datetime64[ns]')
+    elif isinstance(base, (td64, pd.Timedelta)):
+        step  = td64(base, 'ns')
+        first = max(np.asarray(A['time'].values[0], dtype='datetime64[ns]') for A in sensors.values())
+        last  = min(np.asarray(A['time'].values[-1], dtype='datetime64[ns]') for A in sensors.values())
+        first = dt64(0, 'ns') + -(-(first - dt64(0, 'ns')) // step) * step
+        tb    = np.arange(first, last + td64(1, 'ns'), step)
+    else: tb = np.asarray(base, dtype='datetime64[ns]')
+    if t0 is not None: tb = tb[tb >= dt64(t0, 'ns')]
+    if t1 is not None: tb = tb[tb <= dt64(t1, 'ns')]
+    return tb
+
+
+def Coregister(sensors, base, method = 'nearest', tolerance = None, t0 = None, t1 = None, chunk = td64(1, 'D')):
+    '''
+    Align sensors onto a common time base. sensors is a dictionary name > DataArray on dimension
+    'time' (sorted), or name > sensor tuple (GetSensorTuple()) whose first entry is used. base as
+    in TimeBase(). method (or a dictionary name > method) as in AlignTimes(). tolerance defaults to
+    the median spacing of the base. Works chunk by chunk (chunk of base time): each chunk loads only
+    the source samples within tolerance of it, so month-long lazily loaded inputs stay bounded.
+    Returns a Dataset on 'time' with one variable per sensor (attributes kept).
+    '''
+    sensors, tb, tol, methods = CoregisterSetup(sensors, base, method, tolerance, t0, t1)
+    out = {k: np.full(len(tb), np.nan) for k in sensors}
+    if len(tb):
+        edges = np.searchsorted(tb, tb[0] + np.arange(1, int((tb[-1] - tb[0]) // td64(chunk, 'ns')) + 1)*td64(chunk, 'ns'))
+        edges = np.unique(np.concatenate(([0], edges, [len(tb)])))
+        for k, A in sensors.items():
+            ts = np.asarray(A['time'].values, dtype='datetime64[ns]')
+            for b0, b1 in zip(edges[:-1], edges[1:]):
+                lo = np.searchsorted(ts, tb[b0] - tol, side='left')
+                hi = np.searchsorted(ts, tb[b1 - 1] + tol, side='right')
+                out[k][b0:b1] = AlignTimes(ts[lo:hi], A.isel(time=slice(lo, hi)).values, tb[b0:b1], methods[k], tol)
+
+    ds = xr.Dataset({k: ('time', out[k], sensors[k].attrs) for k in sensors}, coords={'time': tb})
+    ds.attrs['coregister'] = CoregisterSpec(sensors, base, methods, tol, t0, t1)
+    return ds
+
+
+def CoregisterSetup(sensors, base, method, tolerance, t0, t1):
+    '''Resolve Coregister() arguments: (sensor DataArrays, base times, tolerance, methods by sensor)'''
+    sensors = {k: (A[0] if isinstance(A, tuple) else A) for k, A in sensors.items()}
+    tb = TimeBase(sensors, base, t0, t1)
+    if tolerance is None: tolerance = np.median(np.diff(tb)) if len(tb) > 1 else td64(1, 's')
+    methods = method if isinstance(method, dict) else {k: method for k in sensors}
+    return sensors, tb, td64(tolerance, 'ns'), methods
+
+
+def CoregisterSpec(sensors, base, methods, tolerance, t0, t1):
+    '''A string describing a Coregister() product: stored with it and compared by CoregisterCached()'''
+    if isinstance(base, str): b = 'sensor ' + base
+    elif isinstance(base, (td64, pd.Timedelta)): b = 'step ' + str(td64(base, 'ns'))
+    else:
+        tb = np.asarray(base, dtype='datetime64[ns]')
+        b  = 'times ' + str(len(tb)) + ' ' + (str(tb[0]) + ' ' + str(tb[-1]) if len(tb) else '')
+    src = ', '.join(k + ' ' + methods[k] + ' ' + str(sensors[k].sizes['time']) + ' ' + \
+                    str(sensors[k]['time'].values[0]) + ' ' + str(sensors[k]['time'].values[-1]) for k in sensors)
+    return 'base ' + b + '; tolerance ' + str(tolerance) + '; window ' + str(t0) + ' ' + str(t1) + '; ' + src
+
+
+def CoregisterCached(cachefnm, sensors, base, method = 'nearest', tolerance = None, t0 = None, t1 = None, \
+                     chunk = td64(1, 'D')):
+    '''
+    Coregister() with a NetCDF cache: If cachefnm holds a product made with the same specification
+    (sensors, source extents, base, methods, tolerance, window) it is loaded; otherwise the product
+    is computed and written to cachefnm (atomically) for next time.
+    '''
+    if os.path.exists(cachefnm):
+        srcs, tb, tol, methods = CoregisterSetup(sensors, base, method, tolerance, t0, t1)
+        with xr.open_dataset(cachefnm) as ds:
+            if ds.attrs.get('coregister') == CoregisterSpec(srcs, base, methods, tol, t0, t1): return ds.load()
+    ds = Coregister(sensors, base, method, tolerance, t0, t1, chunk)
+    WriteAtomic(ds, cachefnm)
+    return ds
@@ -3,6 +3,8 @@ from os.path import join as joindir
 import numpy as np, pandas as pd, xarray as xr
 from numpy import datetime64 as dt64, timedelta64 as td64
 
+from timeutil import DayIndex
+
 
 warnings.filterwarnings('ignore')
 
@@ -113,9 +115,7 @@ def ReformatDataFile(verbose=False):
     # !!!!! streamline hardcode
         
     print('\n\nEnsure the new Dimension is sorted (no User action)\n')    
-    df   = ds.to_dataframe()
-    vals = [xr.DataArray(data=df[c], dims=['time'], coords={'time':df.index}, attrs=ds[c].attrs) for c in df.columns]
-    ds   = xr.Dataset(dict(zip(df.columns, vals)), attrs=ds.attrs)
+    ds = SortTime(ds)
 
     
     print('\n\nSelect output time window (Format yyyy-mm-dd or enter to use the defaults)\n')
@@ -130,8 +130,7 @@ def ReformatDataFile(verbose=False):
     
     # This code eliminates duplicate-time entries. See data.ipynb for remarks on 
     #   sensor data.
-    _, keeper_index = np.unique(ds['time'], return_index=True)
-    ds=ds.isel(time=keeper_index)
+    ds = DropDuplicateTimes(ds)
 
     print('\n\nHere is the resulting dataset summary view:\n')
     print(ds)
@@ -148,89 +147,410 @@ def ReformatDataFile(verbose=False):
 
 
 
-def ProfileGenerator(sourcefnm, z_key, verbose = False):
+def TimeIndex(t, t0 = None, t1 = None):
     """
-    ProfileGenerator traverses pandas Series z of pressures/depths and matching pandas Series t of times.
-    It produces six event lists that are suitable for writing as a pandas DataFrame CSV file.
-    
-    The code is adapted to 1Min per sample and z is increasing up / shallow. (See 'z_direction'.)
-    The code returns a set of 6 lists: t0/t1 for rest, ascent, and descent events.
-        r0, r1, a0, a1, d0, d1
-    List entries are triples (i, t, z): Respectively Index of, time of, and depth of the event. 
-    The first event is presumed to be a rest r0 to r1. r1 coincides with first ascent a0. The 
-    first possible event index i is m0; the last is len_z - m1 - 1. len_z is the number of values 
-    in the time series; and we truncate by m0/m1 to permit time window derivatives.
-    
-    Note that z[m0] is m0 minutes ahead of z[0] since samples are assumed to be one per minute.
-    Likewise z[len_z - m1 - 1] is m1 minutes behind z[len_z - 1]. The depth values z[] are taken 
-    to be negative down from 0 at the surface.
-    
-    Time-series derivatives are taken in terms of (later) - (earlier) in the normal sense.
-    Conditions for identifying an Ascent start:
-      - Slope from past to present is less than a threshold (flat)
-      - Slope from present to future is positive (rising)
-      - Profiler depth < threshold (eliminates some false positives)
-    And similarly for Descent start and Rest start.
-    After a detection of ascent start the i search index is bumped forward in time to avoid
-      subsequent false positives.
+    Normalize a time coordinate t using the time values alone: Returns an indexer into t that
+    sorts it, keeps the first occurrence of each duplicated time and selects the window 
+    [t0, t1] (inclusive, as in sel(time=slice(t0, t1)); None for an open end). 
+    The (stable) argsort only runs if t is not already sorted; if t is sorted and free of 
+    duplicates the indexer is a slice so that the selection stays a zero-copy / lazy view.
     """
-    
-    ds = xr.open_dataset(sourcefnm)
+    t = np.asarray(t)
+    is_sorted = bool(np.all(t[1:] >= t[:-1]))
+    order = None if is_sorted else np.argsort(t, kind='stable')
+    ts = t if is_sorted else t[order]
 
-    # should add: if dim not 'time' return False
-    
-    z = ds[z_key].to_series()
-    t = ds['time'].to_series()
+    lo = 0 if t0 is None else int(np.searchsorted(ts, np.datetime64(t0, 'ns'), side='left'))
+    hi = len(ts) if t1 is None else int(np.searchsorted(ts, np.datetime64(t1, 'ns'), side='right'))
+    window = ts[lo:hi]
+    first  = np.ones(len(window), dtype=bool)
+    first[1:] = window[1:] != window[:-1]
+
+    if is_sorted and first.all(): return slice(lo, hi)
+    idx = np.arange(lo, hi)[first]
+    return idx if is_sorted else order[idx]
+
+
+def NormalizeTime(ds, t0 = None, t1 = None):
+    """
+    Sort / de-duplicate / subset Dataset ds on its time dimension: One combined TimeIndex() indexer 
+    applied with isel() to every variable. Lazily loaded variables stay lazy until written (which
+    then proceeds one variable at a time): Peak memory is about one variable, not the whole Dataset.
+    """
+    return ds.isel(time=TimeIndex(ds['time'].values, t0, t1))
+
+
+def SortTime(ds):
+    """Sort Dataset ds on its time dimension (see NormalizeTime())"""
+    t = ds['time'].values
+    return ds if np.all(t[1:] >= t[:-1]) else ds.isel(time=np.argsort(t, kind='stable'))
+
+
+def DropDuplicateTimes(ds):
+    """Eliminate duplicate-time entries from Dataset ds (keeps the first of each)"""
+    return NormalizeTime(ds)
+
+
+def SortTimeDataFrame(ds):
+    """
+    The original time sort by way of a pandas DataFrame round-trip: Retained for comparison 
+    (benchmark.BenchmarkTimeNormalization()). Copies the whole Dataset several times.
+    """
+    df   = ds.to_dataframe().sort_index()
+    vals = [xr.DataArray(data=df[c], dims=['time'], coords={'time':df.index}, attrs=ds[c].attrs) for c in df.columns]
+    return xr.Dataset(dict(zip(df.columns, vals)), attrs=ds.attrs)
+
+
+#############################
+#
+# Headless reformat pipeline: ReformatDataFile() driven by a declarative spec
+#
+#############################
+
+# A reformat spec is a dictionary. Only 'input' and 'output' are required:
+#   data_root    folder holding <site>/<structure>/<instrument>; default os.getcwd() + '/data/rca'
+#   site         e.g. 'OregonSlopeBase'; structure 'profiler' (default) or 'platform'; instrument e.g. 'ctd'
+#   input        NetCDF filename or glob pattern, relative to the instrument folder (if site given)
+#   output       output filename; may use {stem} for the input file name without extension
+#   swap_dims    e.g. {'row': 'time'}
+#   coords       {'drop': [...], 'rename': {old: new}}
+#   data_vars    {'keep': [...], 'drop': [...], 'rename': {old: new}}; keep (if given) drops all others
+#   attrs        list of global attributes to preserve (all others are dropped)
+#   t0, t1       output time window 'yyyy-mm-dd'
+#
+# With site given, instrument is required too.
+# A config is a spec, a list of specs, {'defaults': spec, 'jobs': [spec, ...]} or a YAML file of any of these.
+
+reformat_defaults = {'data_root': os.getcwd() + '/data/rca', 'structure': 'profiler', 'swap_dims': {'row': 'time'}, 'attrs': []}
+
+
+def ReformatDataset(ds, spec):
+    """
+    The ReformatDataFile() steps applied to Dataset ds without user interaction: swap dimensions,
+    drop / rename coordinates, keep / drop / rename data variables, drop attributes; then sort time,
+    select the time window and eliminate duplicate time entries in one NormalizeTime() step.
+    Returns the new Dataset.
+    """
+    for old_dim, new_dim in spec.get('swap_dims', {}).items():
+        if old_dim in ds.dims and (new_dim in ds.data_vars or new_dim in ds.coords):
+            ds = ds.swap_dims({old_dim:new_dim})
+
+    coords = spec.get('coords', {})
+    ds = ds.drop_vars([c for c in coords.get('drop', []) if c in ds.coords])
+    ds = ds.rename({k: v for k, v in coords.get('rename', {}).items() if k in ds.coords})
+
+    data_vars = spec.get('data_vars', {})
+    if 'keep' in data_vars: ds = ds[[dv for dv in data_vars['keep'] if dv in ds.data_vars]]
+    ds = ds.drop_vars([dv for dv in data_vars.get('drop', []) if dv in ds.data_vars])
+    ds = ds.rename({k: v for k, v in data_vars.get('rename', {}).items() if k in ds.data_vars})
+
+    preserve = spec.get('attrs', [])
+    ds.attrs = {k: v for k, v in ds.attrs.items() if k in preserve}
+
+    return NormalizeTime(ds, spec.get('t0'), spec.get('t1'))
+
+
+def ReformatJobs(config):
+    """
+    Expand a reformat config (see reformat_defaults and the spec notes above) into a list of
+    (input filename, output filename, spec) jobs: one per input file matched. A spec missing a
+    required key raises ValueError.
+    """
+    if isinstance(config, str):
+        import yaml                                      # optional: only needed for YAML configs
+        with open(config) as f: config = yaml.safe_load(f)
+    if isinstance(config, dict) and 'jobs' in config: 
+        defaults, specs = config.get('defaults', {}), config['jobs']
+    else:
+        defaults, specs = {}, config if isinstance(config, list) else [config]
+
+    jobs = []
+    for spec in specs:
+        spec = {**reformat_defaults, **defaults, **spec}
+        missing = [k for k in ['input', 'output'] + (['instrument'] if 'site' in spec else []) if k not in spec]
+        if missing: raise ValueError('reformat spec ' + str(spec) + ' is missing ' + ', '.join(missing))
+        folder = joindir(spec['data_root'], spec['site'], spec['structure'], spec['instrument']) if 'site' in spec else ''
+        for fnm in sorted(glob.glob(joindir(folder, spec['input']))):
+            stem = os.path.splitext(os.path.basename(fnm))[0]
+            jobs.append((fnm, spec['output'].format(stem=stem), spec))
+    return jobs
+
+
+def ReformatDataFileJob(infnm, outfnm, spec):
+    """
+    Process pool worker: Reformat one file and write the result atomically (to a temporary 
+    file in the output folder, then renamed) so a failed run never leaves a partial output.
+    """
+    with xr.open_dataset(infnm) as ds: WriteAtomic(ReformatDataset(ds, spec), outfnm)
+    return outfnm
+
+
+def WriteAtomic(ds, outfnm, encoding = None):
+    """
+    Write Dataset ds to NetCDF file outfnm by way of a temporary file in the same folder that is 
+    renamed on success: Readers never see a partial file and a failure leaves no output behind.
+    """
+    outdir = os.path.dirname(os.path.abspath(outfnm))
+    os.makedirs(outdir, exist_ok=True)
+    tmpfnm = joindir(outdir, '.' + os.path.basename(outfnm) + '.' + str(os.getpid()) + '.tmp')
+    try:
+        ds.to_netcdf(tmpfnm, encoding=encoding)
+        os.replace(tmpfnm, outfnm)
+    finally:
+        if os.path.exists(tmpfnm): os.remove(tmpfnm)
+    return outfnm
+
+
+def ReformatDataFiles(config, max_workers = None, verbose = True):
+    """
+    Headless version of ReformatDataFile(): Run every job of a reformat config (dictionary, list or
+    YAML filename; see ReformatJobs()) in a concurrent.futures process pool. Returns a dictionary
+    input filename > output filename, or > the exception raised for that file.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    jobs, results = ReformatJobs(config), {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(ReformatDataFileJob, *job): job[0] for job in jobs}
+        for future, infnm in futures.items():
+            try:              results[infnm] = future.result()
+            except Exception as e: results[infnm] = e
+            if verbose: print(infnm + ' > ' + str(results[infnm]))
+    return results
+
+
+#############################
+#
+# Sample offset indices: per-day (or hourly) offsets into a data file's time dimension
+#
+#############################
+
+# day indices built by DayIndexForFile(): (filename, modification time, size, step) > (starts, offsets)
+day_indices = {}
+
+
+def DayIndexForFile(fnm, step = td64(1, 'D'), sidecar = True):
+    """
+    Return (starts, offsets) of timeutil.DayIndex() for the time dimension of NetCDF file fnm: The
+    samples of day (period) k are isel(time=slice(offsets[k], offsets[k + 1])). Built with one
+    searchsorted on first request; kept in day_indices and, if sidecar, saved next to the file as 
+    fnm + '.dayindex.npz' so that later sessions skip reading the time dimension. A sidecar is 
+    used only while the file's modification time and size match those stored in it; one that
+    cannot be written (read-only folder) is skipped.
+    """
+    stat = os.stat(fnm)
+    step = td64(step, 'ns')
+    key  = (os.path.abspath(fnm), stat.st_mtime_ns, stat.st_size, int(step / td64(1, 'ns')))
+    if key in day_indices: return day_indices[key]
+
+    sidecarfnm = fnm + '.dayindex.npz'
+    if sidecar and os.path.exists(sidecarfnm):
+        with np.load(sidecarfnm) as f:
+            if tuple(f['key']) == key[1:]: day_indices[key] = (f['starts'], f['offsets'])
+    if key not in day_indices:
+        with xr.open_dataset(fnm) as ds: day_indices[key] = DayIndex(ds['time'].values, step)
+        if sidecar:
+            try:
+                with open(sidecarfnm, 'wb') as f:
+                    np.savez(f, key=np.array(key[1:], dtype=np.int64), starts=day_indices[key][0], offsets=day_indices[key][1])
+            except OSError: pass
+    return day_indices[key]
+
+
+# Profile event detection parameters. Slopes are in meters per sample (1Min per sample).
+# -.5, .2, -170, bump 10 worked pretty well for r0: osb jan 2022 but was 1-too-high for jul 2021
+profile_parameters = {
+    'm0':                  8,              # samples behind the candidate index (backward slope)
+    'm1':                  8,              # samples ahead of the candidate index (forward slope)
+    'ascent_threshold0':   0.2,
+    'ascent_threshold1':   0.5,
+    'ascent_min_depth':    -170.,
+    'ascent_bump_i':       10,             # 7 "works" but a bit bigger is maybe no harm
+    'descent_threshold0':  -0.2,
+    'descent_threshold1':  -0.5,
+    'descent_bump_i':      10,
+    'rest_threshold0':     -0.5,
+    'rest_threshold1':     0.2,
+    'rest_min_depth':      -170.,
+    'rest_bump_i':         12
+    }
+
+
+def ProfileEventMasks(z, params = profile_parameters):
+    """
+    Vectorized first stage of profile detection: One NumPy pass over the depth array z
+    computes the backward slope0 and forward slope1 at every candidate index i in 
+    [m0, len_z - m1). Returns three boolean arrays of length len_z (ascent, descent, rest)
+    that are True where that event start condition (including the depth condition) holds.
+    Indices outside the candidate range are False. As in the if/elif chain of ProfileEventsLoop()
+    a passing ascent slope test (at any depth) rules out descent and rest at that index, and a
+    passing descent slope test rules out rest: The slope ranges may overlap for custom params.
+    """
+    z     = np.asarray(z, dtype=float)
+    len_z = len(z)
+    m0, m1 = params['m0'], params['m1']
+    a_mask = np.zeros(len_z, dtype=bool)
+    d_mask = np.zeros(len_z, dtype=bool)
+    r_mask = np.zeros(len_z, dtype=bool)
+    if len_z <= m0 + m1: return a_mask, d_mask, r_mask
+
+    zi     = z[m0:len_z - m1]
+    slope0 = (zi - z[0:len_z - m1 - m0])/m0
+    slope1 = (z[m0 + m1:len_z] - zi)/m1
+
+    a_slope = (slope0 <= params['ascent_threshold0']) & (slope1 >= params['ascent_threshold1'])
+    d_slope = (slope0 >= params['descent_threshold0']) & (slope1 <= params['descent_threshold1']) & ~a_slope
+    r_slope = (slope0 <= params['rest_threshold0']) & (np.abs(slope1) <= params['rest_threshold1']) & ~a_slope & ~d_slope
+
+    a_mask[m0:len_z - m1] = a_slope & (zi <= params['ascent_min_depth'])
+    d_mask[m0:len_z - m1] = d_slope
+    r_mask[m0:len_z - m1] = r_slope & (zi <= params['rest_min_depth'])
+    return a_mask, d_mask, r_mask
+
+
+def ProfileCandidates(z, params = profile_parameters):
+    """
+    Compact form of ProfileEventMasks(): Returns (idx, kind) where idx holds the sample
+    indices at which some event start condition holds and kind is 1 ascent, 2 descent, 3 rest.
+    """
+    a_mask, d_mask, r_mask = ProfileEventMasks(z, params)
+    kind = np.select([a_mask, d_mask, r_mask], [1, 2, 3], 0).astype(np.int8)   # loop's if/elif order
+    idx  = np.flatnonzero(kind)
+    return idx, kind[idx]
+
+
+def ProfileEventState(first_rest = 0):
+    """
+    Detector state carried by ProfileEventStep(): The most recent a0/d0/r0 start indices, the 
+    search index after the last bump and the candidate final descent end (first rest condition
+    m0 or more samples past the most recent descent start).
+    """
+    return {'a0': None, 'd0': None, 'r0': first_rest, 'next_i': 0, 'final_d1': None}
+
+
+def ProfileEventStep(idx, kind, state, params = profile_parameters):
+    """
+    Visit candidates (idx, kind) from ProfileCandidates() in order applying the ordering rules
+    and the 'bump' that skips the search index forward after each detection. state comes from 
+    ProfileEventState() and is updated in place so that successive calls on consecutive runs of 
+    candidates give the same result as one call on all of them. Returns the list of accepted
+    (event, index) pairs where event is 'a0', 'd0' or 'r0'.
+    """
+    events = []
+    for i, k in zip(np.asarray(idx).tolist(), np.asarray(kind).tolist()):
+        if k == 3 and state['final_d1'] is None and state['d0'] is not None and i >= state['d0'] + params['m0']:
+            state['final_d1'] = i
+        if i < state['next_i']: continue
+        if k == 1:
+            events.append(('a0', i))
+            state['a0'], state['next_i'] = i, i + params['ascent_bump_i'] + 1
+        elif k == 2:
+            if state['d0'] is None or (state['a0'] is not None and state['d0'] < state['a0']):
+                events.append(('d0', i))
+                state['d0'], state['next_i'], state['final_d1'] = i, i + params['descent_bump_i'] + 1, None
+        elif state['a0'] is not None and state['d0'] is not None and state['r0'] < state['d0']:
+            events.append(('r0', i))
+            state['r0'], state['next_i'] = i, i + params['rest_bump_i'] + 1
+    return events
+
+
+def ProfileEventPostPass(idx, kind, params = profile_parameters, first_rest = 0):
+    """
+    Second stage of profile detection: Run ProfileEventStep() over all the candidates (idx, kind)
+    from ProfileCandidates(). Returns index lists a0, d0, r0 plus the index of the final rest start 
+    (descent end) or None. r0 begins with first_rest (index 0 as in ProfileGenerator()).
+    """
+    state  = ProfileEventState(first_rest)
+    events = ProfileEventStep(idx, kind, state, params)
+    a0 = [i for e, i in events if e == 'a0']
+    d0 = [i for e, i in events if e == 'd0']
+    r0 = [first_rest] + [i for e, i in events if e == 'r0']
+
+    # deal with found a last rest start after the last ascent start
+    if len(r0) == len(a0) + 1: r0.pop()
+    return a0, d0, r0, state['final_d1']
+
+
+def ProfileEventIndices(z, params = profile_parameters):
+    """
+    Profile detection engine operating on a depth array z (negative down, 1Min per sample).
+    Candidate event starts come from one vectorized pass (ProfileCandidates()); the ordering
+    post-pass (ProfileEventPostPass()) then visits only those sparse candidates. 
+    Returns index lists a0, d0, r0 and the final descent end index (or None).
+    """
+    idx, kind = ProfileCandidates(z, params)
+    return ProfileEventPostPass(idx, kind, params)
+
+
+def ProfileEvents(z, t, params = profile_parameters, verbose = False):
+    """
+    Convert ProfileEventIndices() output into the six ProfileGenerator() event lists of 
+    (index, time, depth) triples given depth array z and matching time array t.
+    """
+    zv = np.asarray(z, dtype=float)
+    tv = np.asarray(t)
+    a0i, d0i, r0i, final_d1 = ProfileEventIndices(zv, params)
+
+    def triples(idcs): return list(zip(idcs, pd.DatetimeIndex(tv[idcs]), zv[idcs]))
+
+    return ProfileEventLists(triples(a0i), triples(d0i), triples(r0i), \
+                             None if final_d1 is None else triples([final_d1])[0], verbose)
+
+
+def ProfileEventLists(a0, d0, r0, final_d1 = None, verbose = False):
+    """
+    From event start triples a0, d0, r0 (and the final descent end triple or None) build the 
+    six ProfileGenerator() lists a0, a1, d0, d1, r0, r1 using the event degeneracies.
+    """
+    if verbose: print("there are", len(a0), "ascent starts")
+    if verbose: print("there are", len(d0), "descent starts")
+    if verbose: print("there are", len(r0), "rest starts")
+
+    a1 = d0.copy()             # ascent end = descent start
+    d1 = r0[1:].copy()         # first descent ends at start of 2nd rest start
+    r1 = a0.copy()             # first rest end = first ascent start
+    if final_d1 is not None: d1.append(final_d1)
+
+    return a0, a1, d0, d1, r0, r1
+
+
+def ProfileEventsLoop(z, t, params = profile_parameters, verbose = False):
+    """
+    Reference per-sample loop version of ProfileEvents(): Retained to validate the 
+    vectorized engine and to benchmark against it. Same arguments, same return value.
+    """
+    z = np.asarray(z, dtype=float)
+    t = pd.DatetimeIndex(t)
+    m0, m1 = params['m0'], params['m1']
 
-    print('Sanity: ' + str(z[0]) + ' is initial depth')
- 
     len_z = len(z)
     a0, d0, r0 = [], [], []               # lists for start times: ascents, descents, rests
     
     r0.append((0,t[0],z[0]))
 
-    m0 = 8
-    m1 = 8
-    ascent_threshold0 = 0.2
-    ascent_threshold1 = .5
-    ascent_min_depth = -170.
-    ascent_bump_i = 10                     # 7 "works" but a bit bigger is maybe no harm
-    descent_threshold0 = -0.2
-    descent_threshold1 = -0.5
-    descent_bump_i = 10
-    rest_threshold0 = -0.5                 # -.5, .2, -170, bump 10 worked pretty well for r0: osb jan 2022
-                                           #    but was 1-too-high for jul 2021
-    rest_threshold1 = 0.2             
-    rest_min_depth = -170.
-    rest_bump_i = 12
-
-    # This pushes the index forward after an a0 is detected to skip some false positives
-    ascent_threshold0 = 0.2
-    ascent_threshold1 = .5
-    
     i = m0
     while i < len_z - m1:      # i is a candidate index for A/D/R starts
         
         slope0 = (z[i] - z[i-m0])/m0
         slope1 = (z[i+m1] - z[i])/m1
         
-        if slope0 <= ascent_threshold0 and slope1 >= ascent_threshold1:
-            if z[i] <= ascent_min_depth:
+        if slope0 <= params['ascent_threshold0'] and slope1 >= params['ascent_threshold1']:
+            if z[i] <= params['ascent_min_depth']:
                 a0.append((i, t[i], z[i]))
-                i += ascent_bump_i
+                i += params['ascent_bump_i']
                 
-        elif slope0 >= descent_threshold0 and slope1 <= descent_threshold1:        
+        elif slope0 >= params['descent_threshold0'] and slope1 <= params['descent_threshold1']:
             # (no depth condition) so on to the cases where this is considered a new descent:
             #   No descents found yet OR the most recent descent precedes the most recent ascent
             if (not len(d0)) or (len(a0) and len(d0) and d0[-1][0] < a0[-1][0]):
                 d0.append((i, t[i], z[i]))
-                i += descent_bump_i
+                i += params['descent_bump_i']
                 
-        elif slope0 <= rest_threshold0 and abs(slope1) <= rest_threshold1:
-            if z[i] <= rest_min_depth:
+        elif slope0 <= params['rest_threshold0'] and abs(slope1) <= params['rest_threshold1']:
+            if z[i] <= params['rest_min_depth']:
                 if (not len(r0)) or (len(a0) and len(d0) and len(r0) and r0[-1][0] < d0[-1][0]):
                     r0.append((i, t[i], z[i]))
-                    i += rest_bump_i
+                    i += params['rest_bump_i']
 
         i += 1
 
@@ -246,19 +566,112 @@ def ProfileGenerator(sourcefnm, z_key, verbose = False):
     r1 = a0.copy()             # first rest end = first ascent start
 
     # The final d1 must still be determined
-    i = d0[-1][0] + m0
+    i = d0[-1][0] + m0 if len(d0) else len_z
     while i < len_z - m1:
         slope0 = (z[i] - z[i-m0])/m0
         slope1 = (z[i+m1] - z[i])/m1
-        if slope0 <= rest_threshold0 and abs(slope1) <= rest_threshold1:
-            if z[i] <= rest_min_depth:
+        if slope0 <= params['rest_threshold0'] and abs(slope1) <= params['rest_threshold1']:
+            if z[i] <= params['rest_min_depth']:
                 d1.append((i, t[i], z[i]))
                 i = len_z - m1
         i += 1
                 
+    return a0, a1, d0, d1, r0, r1
+
+
+def StreamProfileEvents(sourcefnm, z_key, window = 1000000, params = profile_parameters):
+    """
+    Streaming profile detection for depth files larger than memory: A generator that reads the
+    time and z_key variables of NetCDF file sourcefnm in windows of (window) samples and yields
+    event starts as they are found: (event, (index, time, depth)) where event is 'r0', 'a0' or 
+    'd0'. The first yield is the presumed initial rest (index 0). A final ('d1', ...) is yielded
+    at the end if a last descent end is found. Indices are sample indices into the file.
+
+    The last m0 + m1 samples of each window are carried over as a halo to the next so that the 
+    slopes match a single pass; the detector state (ProfileEventState()) carries the last a0/d0/r0
+    across window boundaries. Peak memory is set by the window size, not the file length. The file
+    is closed when the generator finishes or is closed (e.g. a caller that stops iterating early).
+    """
+    m0, m1 = params['m0'], params['m1']
+    if window <= m0 + m1: window = m0 + m1 + 1
+
+    with xr.open_dataset(sourcefnm, create_default_indexes=False) as ds:     # do not load the time index
+        n  = ds.sizes['time']
+        if not n: return
+
+        carry_z, carry_t = np.zeros(0), np.zeros(0, dtype=ds['time'].dtype)   # not ds['time'].values: that loads every time
+        offset, state, final_d1 = 0, ProfileEventState(0), None
+        for w0 in range(0, n, window):
+            z = np.concatenate((carry_z, ds[z_key][w0:w0 + window].values.astype(float)))
+            t = np.concatenate((carry_t, ds['time'][w0:w0 + window].values))
+            if not w0: yield ('r0', (0, pd.Timestamp(t[0]), z[0]))
+
+            idx, kind = ProfileCandidates(z, params)
+            for event, i in ProfileEventStep(idx + offset, kind, state, params):
+                yield (event, (i, pd.Timestamp(t[i - offset]), z[i - offset]))
+            if state['final_d1'] is not None and (final_d1 is None or final_d1[0] != state['final_d1']):
+                i = state['final_d1']
+                final_d1 = (i, pd.Timestamp(t[i - offset]), z[i - offset])
+
+            # halo: the final m0 + m1 samples have not yet been evaluated as candidates
+            carry_z, carry_t = z[-(m0 + m1):], t[-(m0 + m1):]
+            offset += len(z) - len(carry_z)
+
+        if state['final_d1'] is not None: yield ('d1', final_d1)
+
+
+def ProfileGenerator(sourcefnm, z_key, verbose = False, window = None):
+    """
+    ProfileGenerator traverses pandas Series z of pressures/depths and matching pandas Series t of times.
+    It produces six event lists that are suitable for writing as a pandas DataFrame CSV file.
+    
+    The code is adapted to 1Min per sample and z is increasing up / shallow. (See 'z_direction'.)
+    The code returns a set of 6 lists: t0/t1 for rest, ascent, and descent events.
+        r0, r1, a0, a1, d0, d1
+    List entries are triples (i, t, z): Respectively Index of, time of, and depth of the event. 
+    The first event is presumed to be a rest r0 to r1. r1 coincides with first ascent a0. The 
+    first possible event index i is m0; the last is len_z - m1 - 1. len_z is the number of values 
+    in the time series; and we truncate by m0/m1 to permit time window derivatives.
+    
+    Note that z[m0] is m0 minutes ahead of z[0] since samples are assumed to be one per minute.
+    Likewise z[len_z - m1 - 1] is m1 minutes behind z[len_z - 1]. The depth values z[] are taken 
+    to be negative down from 0 at the surface.
+    
+    Time-series derivatives are taken in terms of (later) - (earlier) in the normal sense.
+    Conditions for identifying an Ascent start:
+      - Slope from past to present is less than a threshold (flat)
+      - Slope from present to future is positive (rising)
+      - Profiler depth < threshold (eliminates some false positives)
+    And similarly for Descent start and Rest start.
+    After a detection of ascent start the i search index is bumped forward in time to avoid
+      subsequent false positives.
+
+    Detection runs in ProfileEvents(): Slopes for the whole series are computed in one NumPy
+    pass; only the candidate event indices are visited in Python. The per-sample loop is kept
+    as ProfileEventsLoop() and gives identical event lists. Thresholds: profile_parameters.
+
+    With window = (number of samples) the file is read in pieces via StreamProfileEvents() 
+    rather than loaded whole: Same event lists, bounded memory.
+    """
+    if window is not None:
+        events = {'a0': [], 'd0': [], 'r0': [], 'd1': []}
+        for event, triple in StreamProfileEvents(sourcefnm, z_key, window): events[event].append(triple)
+        if len(events['r0']) == len(events['a0']) + 1: events['r0'].pop()
+        return ProfileEventLists(events['a0'], events['d0'], events['r0'], \
+                                 events['d1'][0] if len(events['d1']) else None, verbose)
+    
+    ds = xr.open_dataset(sourcefnm)
+
+    # should add: if dim not 'time' return False
+    
+    z = ds[z_key].values
+    t = ds['time'].values
+
+    print('Sanity: ' + str(z[0]) + ' is initial depth')
+
     # redacted: logic check on order of stamp indices
     # Returning lists of tuples: (index, time, depth)
-    return a0, a1, d0, d1, r0, r1
+    return ProfileEvents(z, t, verbose=verbose)
 
 
 def ProfileWriter(ofnm, a0, a1, d0, d1, r0, r1):
@@ -285,4 +698,200 @@ def ProfileWriter(ofnm, a0, a1, d0, d1, r0, r1):
     df = pd.DataFrame(data=np.array([np.array(x) for x in profiles]))
     df.to_csv(ofnm)
 
-    return True
\ No newline at end of file
+    return True
+
+
+
+
+# Profile metadata events in ProfileWriter() column order: Each event is an (index, time, depth) triple
+profile_events = ['r0', 'r1', 'a0', 'a1', 'd0', 'd1']
+
+
+def ProfileDataset(a0, a1, d0, d1, r0, r1):
+    """
+    Build a typed, columnar profile metadata Dataset from the ProfileGenerator() event lists: 
+    One row per profile along dimension 'profile'; for each event e in profile_events there is
+    an int64 sample index e + 'i', a datetime64 time e + 't' and a float depth e + 'z'.
+    Returns None if the event lists differ in length.
+    """
+    lists = dict(zip(profile_events, (r0, r1, a0, a1, d0, d1)))
+    if len(set(len(x) for x in lists.values())) > 1: return None
+    data_vars = {}
+    for e in profile_events:
+        data_vars[e + 'i'] = ('profile', np.array([x[0] for x in lists[e]], dtype=np.int64))
+        data_vars[e + 't'] = ('profile', pd.DatetimeIndex([x[1] for x in lists[e]]).values.astype('datetime64[ns]'))
+        data_vars[e + 'z'] = ('profile', np.array([x[2] for x in lists[e]], dtype=float))
+    return xr.Dataset(data_vars)
+
+
+def ProfileMetadataWriter(ofnm, a0, a1, d0, d1, r0, r1):
+    '''
+    Binary alternative to ProfileWriter(): Write the event lists generated by ProfileGenerator()
+    as a compact NetCDF file (see ProfileDataset()). Read it back with ReadProfileMetadata().
+    '''
+    ds = ProfileDataset(a0, a1, d0, d1, r0, r1)
+    if ds is None: return False
+    ds.to_netcdf(ofnm)
+    return True
+
+
+def ConvertProfileCSV(csvfnm, ofnm = None):
+    '''
+    One-time conversion of a ProfileWriter() CSV file to the ProfileMetadataWriter() NetCDF format.
+    The output filename defaults to the CSV filename with extension .nc. Returns the output filename.
+    '''
+    df = pd.read_csv(csvfnm, index_col=0)
+    events = []
+    for k in range(len(profile_events)):
+        i = df[str(3*k)].astype(np.int64).values
+        t = pd.to_datetime(df[str(3*k + 1)]).values
+        z = df[str(3*k + 2)].astype(float).values
+        events.append(list(zip(i, t, z)))
+    r0, r1, a0, a1, d0, d1 = events
+    if ofnm is None: ofnm = os.path.splitext(csvfnm)[0] + '.nc'
+    ProfileMetadataWriter(ofnm, a0, a1, d0, d1, r0, r1)
+    return ofnm
+
+#############################
+#
+# Batch profile generation: many sites, many months
+#
+#############################
+
+profile_sites = ['OregonSlopeBase', 'OregonOffshore', 'AxialBase']
+
+
+def MonthChunks(date0, date1):
+    """
+    Split the time range [date0, date1) into month-sized (t0, t1) pairs on calendar month
+    boundaries. The first and last chunks may be partial months.
+    """
+    date0, date1 = dt64(date0, 'ns'), dt64(date1, 'ns')
+    months = np.arange(dt64(date0, 'M') + 1, dt64(date1, 'M') + 1).astype('datetime64[ns]')
+    bounds = [date0] + [m for m in months if date0 < m < date1] + [date1]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def ProfileSourceIndex(sourcefnms, bounds):
+    """
+    One pass over the time coordinates of a site's time-ordered source files, for the parent process
+    of BatchProfileGenerator(). Duplicate times where files overlap are dropped (first occurrence kept):
+    Each file contributes its samples from k0 on. Returns (files, offsets): files lists (filename, k0,
+    s0, s1) with s0, s1 the range of record sample indices of the file's kept samples; offsets are the
+    record sample indices of the datetime64 times bounds (the first sample at or after each).
+    """
+    bounds  = np.asarray(bounds, dtype='datetime64[ns]')
+    offsets = np.zeros(len(bounds), dtype=np.int64)
+    files, s0, t_last = [], 0, None
+    for f in sourcefnms:
+        with xr.open_dataset(f, create_default_indexes=False) as ds: tf = ds['time'].values.astype('datetime64[ns]')
+        k0 = 0 if t_last is None else int(np.searchsorted(tf, t_last, side='right'))
+        if k0 < len(tf): t_last = tf[-1]
+        offsets += np.searchsorted(tf[k0:], bounds, side='left')
+        files.append((f, k0, s0, s0 + len(tf) - k0))
+        s0 += len(tf) - k0
+    return files, offsets
+
+
+def ProfileChunkWindow(i0, i1, n, params = profile_parameters):
+    """Record samples [lo, hi) loaded for chunk samples [i0, i1) of an n sample record: an m0, m1 halo"""
+    return max(i0 - params['m0'], 0), min(i1 + params['m1'], n)
+
+
+def ProfileChunkCandidates(files, z_key, i0, i1, n, params = profile_parameters):
+    """
+    Process pool worker for BatchProfileGenerator(). files holds the ProfileSourceIndex() rows of the
+    source files that overlap the chunk window: chunk samples [i0, i1) of the n sample site record 
+    plus an m0 sample halo before and m1 after (ProfileChunkWindow()), so that slopes at the chunk
+    edges match a single pass over the full record. Only that window of time and depth is read from
+    each file (lazy isel() slices). Returns (idx, kind, t, z) for the event start candidates with 
+    i0 <= idx < i1; plus the (index, time, depth) triple of the first sample in the chunk (None if
+    the chunk is empty).
+    """
+    lo, hi = ProfileChunkWindow(i0, i1, n, params)
+    t, z = [], []
+    for f, k0, s0, s1 in files:
+        if s1 <= lo or s0 >= hi: continue
+        window = slice(k0 + max(lo - s0, 0), k0 + min(hi, s1) - s0)
+        with xr.open_dataset(f, create_default_indexes=False) as ds:
+            t.append(ds['time'].isel(time=window).values.astype('datetime64[ns]'))
+            z.append(ds[z_key].isel(time=window).values)
+    t = np.concatenate(t) if len(t) else np.zeros(0, dtype='datetime64[ns]')
+    z = np.concatenate(z) if len(z) else np.zeros(0)
+
+    idx, kind = ProfileCandidates(z, params)
+    inside    = (idx + lo >= i0) & (idx + lo < i1)
+    idx, kind = idx[inside], kind[inside]
+    start     = (int(i0), pd.Timestamp(t[i0 - lo]), z[i0 - lo]) if i0 < i1 else None
+    return idx + lo, kind, t[idx], z[idx], start
+
+
+def BatchProfileGenerator(sources, date0, date1, z_key = 'depth', outdir = None, max_workers = None, \
+                          params = profile_parameters, verbose = False):
+    """
+    Generate profile metadata for many sites over a long time range in parallel.
+
+    sources      dictionary: site name (see profile_sites) > list of depth NetCDF files (or one filename)
+    date0        start / end of the time range in the [date0, date1) sense
+    date1
+    z_key        depth data variable name in the source files
+    outdir       if given: write one profile CSV per site as outdir/<site>.csv via ProfileWriter()
+    max_workers  process pool size; None uses the number of cores
+
+    The range is split into month-sized chunks (MonthChunks()) for every site. The time coordinate
+    of each source file is read once, here (ProfileSourceIndex()), to place the chunk bounds in the
+    site record. The chunks run in a concurrent.futures process pool: Each one is given only the 
+    files its window overlaps, reads only its depth values with an m0/m1 sample overlap and returns
+    its event start candidates. Per site the candidates are merged in time order (and
+    deduplicated) before the ordering post-pass, so the resulting event lists are the same as a 
+    single ProfileGenerator() pass over the whole record. Event indices are sample indices into 
+    the site record (all source files concatenated, duplicate times dropped).
+
+    Returns a dictionary: site > (a0, a1, d0, d1, r0, r1) as from ProfileGenerator(). Sites with
+    no data in the time range are omitted.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunks = MonthChunks(date0, date1)
+    sources = {site: [fnms] if isinstance(fnms, str) else list(fnms) for site, fnms in sources.items()}
+    results = {site: [None]*len(chunks) for site in sources}
+
+    # per site one read of each file's times (in this process); each worker gets only the files its chunk overlaps
+    bounds  = [chunks[0][0]] + [t1 for _, t1 in chunks]
+    indices = {site: ProfileSourceIndex(fnms, bounds) for site, fnms in sources.items()}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for site, (files, offsets) in indices.items():
+            n = files[-1][3] if len(files) else 0
+            for j in range(len(chunks)):
+                lo, hi = ProfileChunkWindow(offsets[j], offsets[j + 1], n, params)
+                window = [f for f in files if f[2] < hi and f[3] > lo]
+                futures[pool.submit(ProfileChunkCandidates, window, z_key, int(offsets[j]), int(offsets[j + 1]), n, params)] = (site, j)
+        for future, (site, j) in futures.items():
+            results[site][j] = future.result()
+            if verbose: print(site + ' ' + str(chunks[j][0])[0:10] + ' done')
+
+    profiles = {}
+    for site in sources:
+        idx  = np.concatenate([c[0] for c in results[site]])
+        kind = np.concatenate([c[1] for c in results[site]])
+        t    = np.concatenate([c[2] for c in results[site]])
+        z    = np.concatenate([c[3] for c in results[site]])
+        idx, keep = np.unique(idx, return_index=True)
+        kind, t, z = kind[keep], t[keep], z[keep]
+
+        # as in ProfileGenerator() the first rest start is the first sample of the time range
+        first = [c[4] for c in results[site] if c[4] is not None]
+        if not len(first): continue
+        a0i, d0i, r0i, final_d1 = ProfileEventPostPass(idx, kind, params, first[0][0])
+        where = dict(zip(idx.tolist(), range(len(idx))))
+
+        def triples(idcs): return [(i, pd.Timestamp(t[where[i]]), z[where[i]]) for i in idcs]
+
+        r0 = first[:1] + triples(r0i[1:])
+        profiles[site] = ProfileEventLists(triples(a0i), triples(d0i), r0, \
+                                           None if final_d1 is None else triples([final_d1])[0], verbose)
+        if outdir is not None: ProfileWriter(joindir(outdir, site + '.csv'), *profiles[site])
+    return profiles
+
@@ -0,0 +1,109 @@
+# lod.py module contents
+#   - level of detail (LOD) decimation for long time series charts
+#
+# A pyramid holds, for a time series (t, v), levels of M4 decimation: At each level the series is
+#   cut into buckets of 'size' samples and only the first, minimum, maximum and last sample of each
+#   bucket is kept. A line drawn through those samples covers the same pixels as the full series
+#   when there is at least one bucket per pixel column; so a chart requests the coarsest level that
+#   satisfies its pixel width (LODSelect()).
+
+import os, sys, time, glob, warnings
+from collections import OrderedDict
+import numpy as np, xarray as xr
+from numpy import datetime64 as dt64, timedelta64 as td64
+
+warnings.filterwarnings('ignore')
+
+# pyramids built by LODForFile(): (filename, variable, file modification time) > pyramid, least recently
+#   used first. Each holds a full resolution series, so at most lod_max_files files are kept.
+lod_pyramids  = OrderedDict()
+lod_max_files = 8
+
+
+def M4Indices(v, size):
+    '''
+    Indices into v of the first, minimum, maximum and last samples of each bucket of size
+    consecutive samples; sorted and unique. NaN samples are never chosen as min or max.
+    '''
+    n  = len(v)
+    nb = -(-n // size)
+    w  = np.full(nb*size, np.nan)
+    w[:n] = v
+    w  = w.reshape(nb, size)
+    starts = np.arange(nb)*size
+    lo = starts + np.where(np.isnan(w), np.inf, w).argmin(axis=1)
+    hi = starts + np.where(np.isnan(w), -np.inf, w).argmax(axis=1)
+    last = np.minimum(starts + size - 1, n - 1)
+    idx = np.unique(np.concatenate((starts, lo, hi, last)))
+    return idx[idx < n]
+
+
+def LODPyramid(t, v, base = 16, factor = 4):
+    '''
+    Build a decimation pyramid for time series (t, v): Levels of M4Indices() with bucket sizes base,
+    base*factor, base*factor**2, ... while a level still has more than a few hundred buckets.
+    Returns a dictionary: 't', 'v' (the full resolution arrays) and 'levels' [(size, idx), ...].
+    '''
+    t, v = np.asarray(t), np.asarray(v, dtype=float)
+    levels, size = [], base
+    while len(v) // size >= 256:
+        levels.append((size, M4Indices(v, size)))
+        size *= factor
+    return {'t': t, 'v': v, 'levels': levels}
+
+
+def LODSelect(pyramid, t0 = None, t1 = None, pixels = 1500):
+    '''
+    Return (t, v) for the time range [t0, t1] at the coarsest pyramid level that still has at least
+    one bucket per pixel across a chart pixels wide: Full resolution if the range is short enough.
+    '''
+    t  = pyramid['t']
+    lo = 0 if t0 is None else np.searchsorted(t, t0, side='left')
+    hi = len(t) if t1 is None else np.searchsorted(t, t1, side='right')
+    return LODSelectRange(pyramid, lo, hi, pixels)
+
+
+def LODSelectRange(pyramid, lo, hi, pixels = 1500):
+    '''
+    LODSelect() for the samples [lo, hi) given as offsets (e.g. from data.DayIndexForFile()) rather 
+    than times: No search of the full resolution times.
+    '''
+    t = pyramid['t']
+    level = None
+    for size, idx in pyramid['levels']:
+        if (hi - lo) // size >= pixels: level = idx
+    if level is None: return t[lo:hi], pyramid['v'][lo:hi]
+    idx = level[np.searchsorted(level, lo, side='left'):np.searchsorted(level, hi, side='left')]
+    return t[idx], pyramid['v'][idx]
+
+
+def LODForFile(fnm, key, base = 16, factor = 4):
+    '''
+    Return the pyramid for data variable key of (time dimension) NetCDF file fnm. Built on first
+    request and kept in lod_pyramids for as long as the file is unmodified: Pyramids of an earlier
+    version of the file are dropped, as are those of the least recently used files beyond 
+    lod_max_files.
+    '''
+    path = os.path.abspath(fnm)
+    cache_key = (path, key, os.path.getmtime(fnm))
+    if cache_key in lod_pyramids:
+        lod_pyramids.move_to_end(cache_key)
+        return lod_pyramids[cache_key]
+
+    for k in [k for k in lod_pyramids if k[0] == path and k[2] != cache_key[2]]: del lod_pyramids[k]
+    with xr.open_dataset(fnm) as ds:
+        lod_pyramids[cache_key] = LODPyramid(ds['time'].values, ds[key].values, base, factor)
+    last_use = {k[0]: i for i, k in enumerate(lod_pyramids)}            # file > position of its latest use
+    for oldest in sorted(last_use, key=last_use.get)[:max(len(last_use) - lod_max_files, 0)]:
+        for k in [k for k in lod_pyramids if k[0] == oldest]: del lod_pyramids[k]
+    return lod_pyramids[cache_key]
+
+
+def AxesPixelWidth(ax):
+    '''
+    Pixel width of the plot area of matplotlib Axes ax (its bounding box, after the figure's
+    layout engine e.g. tight_layout has placed it): The number of min/max buckets a trace needs.
+    '''
+    engine = ax.figure.get_layout_engine()
+    if engine is not None: engine.execute(ax.figure)
+    return int(ax.get_window_extent().width)
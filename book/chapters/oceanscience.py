@@ -1,4 +1,5 @@
 from math import cos, pi
+import numpy as np
 
 def OceanScienceCalculation():
     '''
@@ -47,4 +48,75 @@ def OffshoreDistanceFromNewportOregon(lon):
     '''
     ref_lat, ref_lon = 44.6*pi/180, -124*pi/180
     re               = 6378.     # earth radius, kilometers
-    return abs(lon*pi/180 - ref_lon)*cos(ref_lat)*re
\ No newline at end of file
+    return abs(lon*pi/180 - ref_lon)*cos(ref_lat)*re
+
+
+# Seawater properties from the CTD channels: EOS-80 (UNESCO 1983, Fofonoff and Millard) in vectorized
+#   NumPy. Inputs are practical salinity, in situ temperature (deg C, ITS-90; converted to IPTS-68 as
+#   EOS-80 expects) and pressure (dbar). Any mix of arrays and scalars that broadcast.
+def SeawaterDensity(s, t, p = 0.):
+    '''In situ density (kg m-3) of seawater: EOS-80 with the secant bulk modulus'''
+    s, t, p = np.asarray(s, dtype=float), 1.00024*np.asarray(t, dtype=float), np.asarray(p, dtype=float)/10.
+    s15  = s*np.sqrt(s)
+    rhow = 999.842594 + t*(6.793952e-2 + t*(-9.095290e-3 + t*(1.001685e-4 + t*(-1.120083e-6 + t*6.536332e-9))))
+    rho0 = rhow + s*(0.824493 + t*(-4.0899e-3 + t*(7.6438e-5 + t*(-8.2467e-7 + t*5.3875e-9)))) + \
+           s15*(-5.72466e-3 + t*(1.0227e-4 - t*1.6546e-6)) + 4.8314e-4*s*s
+    kw   = 19652.21 + t*(148.4206 + t*(-2.327105 + t*(1.360477e-2 - t*5.155288e-5)))
+    k0   = kw + s*(54.6746 + t*(-0.603459 + t*(1.09987e-2 - t*6.1670e-5))) + s15*(7.944e-2 + t*(1.6483e-2 - t*5.3009e-4))
+    a    = 3.239908 + t*(1.43713e-3 + t*(1.16092e-4 - t*5.77905e-7)) + s*(2.2838e-3 + t*(-1.0981e-5 - t*1.6078e-6)) + 1.91075e-4*s15
+    b    = 8.50935e-5 + t*(-6.12293e-6 + t*5.2787e-8) + s*(-9.9348e-7 + t*(2.0816e-8 + t*9.1697e-10))
+    return rho0 / (1. - p/(k0 + p*(a + p*b)))
+
+
+def AdiabaticLapseRate(s, t68, p):
+    '''Adiabatic temperature gradient (deg C per dbar; IPTS-68 temperature t68): Bryden 1973'''
+    ds = s - 35.
+    return (((-2.1687e-16*t68 + 1.8676e-14)*t68 - 4.6206e-13)*p + ((2.7759e-12*t68 - 1.1351e-10)*ds + \
+             ((-5.4481e-14*t68 + 8.733e-12)*t68 - 6.7795e-10)*t68 + 1.8741e-8))*p + \
+           (-4.2393e-8*t68 + 1.8932e-6)*ds + ((6.6228e-10*t68 - 6.836e-8)*t68 + 8.5258e-6)*t68 + 3.5803e-5
+
+
+def PotentialTemperature(s, t, p, pr = 0.):
+    '''Potential temperature (deg C, ITS-90) referenced to pressure pr (dbar): Fofonoff 1977 Runge-Kutta step'''
+    s, t, p = np.asarray(s, dtype=float), 1.00024*np.asarray(t, dtype=float), np.asarray(p, dtype=float)
+    h  = pr - p
+    xk = h*AdiabaticLapseRate(s, t, p)
+    t  = t + 0.5*xk
+    q  = xk
+    p  = p + 0.5*h
+    xk = h*AdiabaticLapseRate(s, t, p)
+    t  = t + 0.29289322*(xk - q)
+    q  = 0.58578644*xk + 0.121320344*q
+    xk = h*AdiabaticLapseRate(s, t, p)
+    t  = t + 1.707106781*(xk - q)
+    q  = 3.414213562*xk - 4.121320344*q
+    p  = p + 0.5*h
+    xk = h*AdiabaticLapseRate(s, t, p)
+    return (t + (xk - 2.*q)/6.) / 1.00024
+
+
+def SigmaTheta(s, t, p):
+    '''Potential density anomaly (kg m-3): density at the surface of water at its potential temperature, less 1000'''
+    return SeawaterDensity(s, PotentialTemperature(s, t, p), 0.) - 1000.
+
+
+# Flament 2002 spiciness polynomial coefficients b[i][j] of theta**i (s - 35)**j
+spiciness_coefficients = np.array([
+    [ 0.,          7.7442e-01, -5.85e-03,   -9.84e-04,   -2.06e-04  ],
+    [ 5.1655e-02,  2.034e-03,  -2.742e-04,  -8.5e-06,     1.36e-05  ],
+    [ 6.64783e-03,-2.4681e-04, -1.428e-05,   3.337e-05,   7.894e-06 ],
+    [-5.4023e-05,  7.326e-06,   7.0036e-06, -3.0412e-06, -1.0853e-06],
+    [ 3.949e-07,  -3.029e-08,  -3.8209e-07,  1.0012e-07,  4.7133e-08],
+    [-6.36e-10,   -1.309e-09,   6.048e-09,  -1.1409e-09, -6.676e-10 ]])
+
+
+def Spiciness(s, t, p):
+    '''Spiciness (Flament 2002) of practical salinity s at the potential temperature of (s, t, p)'''
+    theta = PotentialTemperature(s, t, p)
+    return np.polynomial.polynomial.polyval2d(theta, np.asarray(s, dtype=float) - 35., spiciness_coefficients)
+
+
+def PressureFromDepth(z, lat = 44.5):
+    '''Pressure (dbar) at depth z (m; the sign is ignored) and latitude lat (degrees): Saunders 1981'''
+    c1 = (5.92 + 5.25*np.sin(np.radians(lat))**2)*1e-3
+    return ((1. - c1) - np.sqrt((1. - c1)**2 - 8.84e-6*np.abs(np.asarray(z, dtype=float)))) / 4.42e-6
@@ -0,0 +1,161 @@
+# qc.py module contents
+#   - per-sample quality control flags for shallow profiler sensor files: out of range, spike, stuck
+#     value, time gap and duplicate (or out of order) timestamp
+#   - flags as one uint8 bit mask per sample in a compact sidecar file next to the data file
+#   - per-profile flag counts keyed to the profile metadata table
+#
+# Bounds come from the shallowprofiler ranges table (else sp_data_ranges) and the spike threshold from
+#   the standard_deviations table. A file is streamed once, chunk by chunk: each chunk is read with a
+#   halo of neighbouring samples so that the rolling median and the stuck run lengths are the same as
+#   for the whole record. Memory is bounded by one chunk plus a byte (and a time stamp) per sample.
+
+import os, sys, time, glob, warnings
+import numpy as np, pandas as pd, xarray as xr
+from numpy import datetime64 as dt64, timedelta64 as td64
+
+from shallowprofiler import ranges, standard_deviations, sp_data_ranges, profile_phases
+from data import WriteAtomic
+
+warnings.filterwarnings('ignore')
+
+# flag bits: a sample's flag is the sum of the bits of the tests it fails; 0 is good
+qc_flags = {'range': 1, 'spike': 2, 'stuck': 4, 'gap': 8, 'duplicate': 16}
+
+# sp_sensorkeys data variable names > ranges / standard_deviations table keys where they differ
+qc_table_keys = {'temperature': 'temp', 'temoperature': 'temp', 'dissolvedoxygen': 'do', 'nitratedark': 'nitrate',
+                 **{'si' + c: 'spkir' + c + 'nm' for c in ('412', '443', '490', '510', '555', '620', '683')}}
+
+
+def QCLimits(key, margin = 0.):
+    '''
+    (lo, hi, sd) for sensor key: The expected range widened by margin (a fraction of its width) on
+    each side, and the upper standard deviation from standard_deviations. None where not tabulated.
+    '''
+    k  = qc_table_keys.get(key, key)
+    lo, hi = ranges.get(k, sp_data_ranges.get(key, (None, None)))
+    if lo is not None: lo, hi = lo - margin*(hi - lo), hi + margin*(hi - lo)
+    sd = standard_deviations.get(k, (None, None))[1]
+    return lo, hi, sd
+
+
+def QCFlags(t, v, lo = None, hi = None, sd = None, window = 5, spike = 3., stuck = 10, gap = None):
+    '''
+    uint8 flags (qc_flags bits) for samples v at sorted datetime64 times t, all tests vectorized:
+      range      v outside [lo, hi]
+      spike      |v - centered rolling median of window samples| > spike * sd
+      stuck      v identical across a run of at least stuck samples
+      gap        more than gap (timedelta64) since the previous sample
+      duplicate  time not later than the previous sample
+    A test is skipped when its parameter is None. NaN values fail no value test.
+    '''
+    t = np.asarray(t, dtype='datetime64[ns]')
+    v = np.asarray(v, dtype=float)
+    f = np.zeros(len(v), dtype=np.uint8)
+    if not len(v): return f
+    with np.errstate(invalid='ignore'):
+        if lo is not None: f[(v < lo) | (v > hi)] |= qc_flags['range']
+        if sd is not None and spike is not None:
+            median = pd.Series(v).rolling(window, center=True, min_periods=1).median().values
+            f[np.abs(v - median) > spike*sd] |= qc_flags['spike']
+    if stuck is not None and stuck > 1:
+        starts = np.concatenate(([0], np.flatnonzero(v[1:] != v[:-1]) + 1))
+        runs   = np.diff(np.append(starts, len(v)))
+        f[np.repeat(runs >= stuck, runs) & np.isfinite(v)] |= qc_flags['stuck']
+    dt = np.diff(t)
+    if gap is not None: f[1:][dt > td64(gap, 'ns')] |= qc_flags['gap']
+    f[1:][dt <= td64(0, 'ns')] |= qc_flags['duplicate']
+    return f
+
+
+def QCFilename(fnm):
+    '''The QC sidecar file of data file fnm'''
+    return fnm + '.qc.nc'
+
+
+def QCFile(fnm, key = None, chunk = 2**20, window = 5, spike = 3., stuck = 10, gap = None, margin = 0., write = True):
+    '''
+    Stream sensor file fnm (data variable key; default the variable that is not 'depth') once in
+    chunks of samples and flag every sample with QCFlags(); bounds from QCLimits(key, margin). gap
+    defaults to ten times the median sample spacing of the first chunk. Returns the flags as a
+    uint8 DataArray key + '_qc' on the file's time coordinate; if write the flags (without the
+    times) are also saved to QCFilename(fnm), stamped with the data file modification time and size.
+    '''
+    with xr.open_dataset(fnm) as ds:
+        if key is None: key = [k for k in ds.data_vars if k != 'depth'][0]
+        lo, hi, sd = QCLimits(key, margin)
+        n     = ds.sizes['time']
+        halo  = max(window // 2, (stuck or 1) - 1, 1)
+        t     = np.empty(n, dtype='datetime64[ns]')
+        flags = np.zeros(n, dtype=np.uint8)
+        for i0 in range(0, n, chunk):
+            i1 = min(i0 + chunk, n)
+            h0, h1 = max(i0 - halo, 0), min(i1 + halo, n)
+            part = ds.isel(time=slice(h0, h1))
+            tc   = part['time'].values.astype('datetime64[ns]')
+            if gap is None: gap = 10*np.median(np.diff(tc)) if len(tc) > 1 else None
+            flags[i0:i1] = QCFlags(tc, part[key].values, lo, hi, sd, window, spike, stuck, gap)[i0 - h0:i1 - h0]
+            t[i0:i1]     = tc[i0 - h0:i1 - h0]
+
+    attrs = {'flag_masks': np.array(list(qc_flags.values()), dtype=np.uint8), 'flag_meanings': ' '.join(qc_flags),
+             'long_name': key + ' quality control flags', 'gap': str(gap), 'window': window, 'spike': spike, 'stuck': stuck}
+    qc = xr.DataArray(flags, dims='time', coords={'time': t}, name=key + '_qc', attrs=attrs)
+    if write:
+        stat = os.stat(fnm)
+        ds = xr.Dataset({qc.name: ('time', flags, attrs)},
+                        attrs={'source': os.path.basename(fnm), 'source_mtime_ns': stat.st_mtime_ns, 'source_size': stat.st_size})
+        WriteAtomic(ds, QCFilename(fnm), encoding={qc.name: {'zlib': True, 'complevel': 1}})
+    return qc
+
+
+def ReadQC(fnm, key = None):
+    '''
+    The flags of data file fnm from its QC sidecar as a DataArray on the data file's time coordinate;
+    None if there is no sidecar or the data file has changed since the flags were written.
+    '''
+    qcfnm = QCFilename(fnm)
+    if not os.path.exists(qcfnm): return None
+    stat = os.stat(fnm)
+    with xr.open_dataset(qcfnm) as q:
+        if (q.attrs.get('source_mtime_ns'), q.attrs.get('source_size')) != (stat.st_mtime_ns, stat.st_size): return None
+        name = key + '_qc' if key is not None else list(q.data_vars)[0]
+        qc   = q[name].load()
+    with xr.open_dataset(fnm) as ds: return qc.assign_coords(time=ds['time'].values)
+
+
+def QCSummary(qc, profiles, phase = 'ascent'):
+    '''
+    Per-profile flag counts: A DataFrame on the index of profile metadata DataFrame profiles
+    (ReadProfileMetadata()) with the number of samples in each profile's phase (inclusive time
+    bounds as in sel(); phase None for the whole profile, rest start to descent end), the count
+    failing each qc_flags test and 'flagged', the count failing any. Counts are differences of
+    cumulative sums, so every profile costs two searchsorted lookups.
+    '''
+    t = qc['time'].values.astype('datetime64[ns]')
+    k0, k1 = profile_phases[phase] if phase is not None else ('r0t', 'd1t')
+    i0 = np.searchsorted(t, profiles[k0].values.astype('datetime64[ns]'), side='left')
+    i1 = np.maximum(np.searchsorted(t, profiles[k1].values.astype('datetime64[ns]'), side='right'), i0)
+    f  = qc.values
+    out = pd.DataFrame({'samples': i1 - i0}, index=profiles.index)
+    for name, bit in list(qc_flags.items()) + [('flagged', 0xff)]:
+        c = np.concatenate(([0], np.cumsum((f & bit) > 0)))
+        out[name] = c[i1] - c[i0]
+    return out
+
+
+def QCFiles(files, profiles = None, phase = 'ascent', verbose = False, **kwargs):
+    '''
+    QCFile() for many sensors and months: files is a dictionary sensor > filename or > list of
+    filenames (e.g. a year of monthly files); one file in memory at a time. kwargs pass to QCFile().
+    Returns a dictionary sensor > QCSummary() over all of that sensor's files (summed, so profiles
+    that straddle two files count once) if profiles is given; else sensor > list of sidecar files.
+    '''
+    out = {}
+    for key, fnms in files.items():
+        for fnm in ([fnms] if isinstance(fnms, str) else fnms):
+            qc = QCFile(fnm, key, **kwargs)
+            if profiles is None: out.setdefault(key, []).append(QCFilename(fnm))
+            else:
+                summary  = QCSummary(qc, profiles, phase)
+                out[key] = summary if key not in out else out[key] + summary
+            if verbose: print(fnm + ': ' + str(int((qc.values > 0).sum())) + ' of ' + str(qc.sizes['time']) + ' samples flagged')
+    return out
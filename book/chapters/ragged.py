@@ -0,0 +1,153 @@
+# ragged.py module contents
+#   - ragged profile arrays: sensor data as (profile x sample) in CF contiguous ragged array form
+#   - vectorized per-profile operations on ragged profile arrays
+#
+# A ragged profile array is an xarray Dataset with two dimensions: 'profile' (one entry per
+#   profile phase, e.g. one ascent) and 'obs' (all samples end to end). Per profile: 'rowSize'
+#   (number of samples), 'phase', 'profile_index' (row of the profile metadata table) and
+#   'profile_time' (phase start). Per sample: the sensor values, 'depth' and 'time'.
+
+import os, sys, time, glob, warnings
+import numpy as np, pandas as pd, xarray as xr
+from numpy import datetime64 as dt64, timedelta64 as td64
+
+from shallowprofiler import profile_phases
+
+warnings.filterwarnings('ignore')
+
+phase_codes = {'rest': 0, 'ascent': 1, 'descent': 2}
+
+
+def RaggedProfiles(profiles, A, Az, phases = ('ascent',), pidcs = None):
+    '''
+    Build a ragged profile array from a profile metadata DataFrame (ReadProfileMetadata()), a sensor
+    DataArray A and its depth DataArray Az. phases is a tuple drawn from 'rest', 'ascent', 'descent';
+    pidcs optionally restricts to a list of profile row labels. Profile phases appear in time order.
+    Sample selection matches A.sel(time=slice(t0, t1)) for each phase's [t0, t1].
+    '''
+    if pidcs is None: pidcs = profiles.index.values
+    rows = pd.Index(profiles.index).get_indexer(pidcs)
+    t    = A['time'].values.astype('datetime64[ns]')
+
+    # one searchsorted per phase over all profile bounds; then order by (profile, phase start)
+    i0, i1, code, label, t0s = [], [], [], [], []
+    for phase in phases:
+        k0, k1 = profile_phases[phase]
+        b0 = profiles[k0].values.astype('datetime64[ns]')[rows]
+        b1 = profiles[k1].values.astype('datetime64[ns]')[rows]
+        i0.append(np.searchsorted(t, b0, side='left'))
+        i1.append(np.searchsorted(t, b1, side='right'))
+        code.append(np.full(len(rows), phase_codes[phase], dtype=np.int8))
+        label.append(np.asarray(pidcs))
+        t0s.append(b0)
+    i0, i1, code, label, t0s = [np.concatenate(x) for x in (i0, i1, code, label, t0s)]
+    order = np.lexsort((t0s, label))
+    i0, i1, code, label, t0s = i0[order], i1[order], code[order], label[order], t0s[order]
+
+    counts = np.maximum(i1 - i0, 0)
+    gather = RaggedGather(i0, counts)
+    name   = A.name if A.name is not None else 'values'
+
+    rag = xr.Dataset(
+        {name:           ('obs', A.values[gather], A.attrs),
+         'depth':        ('obs', Az.values[gather], Az.attrs),
+         'time':         ('obs', t[gather]),
+         'rowSize':      ('profile', counts.astype(np.int64),
+                          {'long_name': 'number of observations for this profile', 'sample_dimension': 'obs'}),
+         'phase':        ('profile', code,
+                          {'flag_values': np.array(list(phase_codes.values()), dtype=np.int8),
+                           'flag_meanings': ' '.join(phase_codes.keys())}),
+         'profile_index':('profile', label.astype(np.int64), {'cf_role': 'profile_id'}),
+         'profile_time': ('profile', t0s)},
+        attrs={'featureType': 'profile', 'Conventions': 'CF-1.8', 'sensor': name})
+    return rag
+
+
+def RaggedGather(starts, counts):
+    '''
+    Return the flat index array that concatenates ranges [starts[k], starts[k] + counts[k]).
+    '''
+    total = int(np.sum(counts))
+    if not total: return np.zeros(0, dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return np.repeat(np.asarray(starts) - offsets, counts) + np.arange(total)
+
+
+def RaggedOffsets(rag):
+    '''Return the offsets array (length number of profiles + 1) into the 'obs' dimension.'''
+    return np.concatenate(([0], np.cumsum(rag['rowSize'].values)))
+
+
+def RaggedProfileIds(rag):
+    '''Return for every sample its profile position 0, 1, ... (length of the 'obs' dimension).'''
+    return np.repeat(np.arange(rag.sizes['profile']), rag['rowSize'].values)
+
+
+def RaggedSegment(rag, k):
+    '''Return (values, depths): zero-copy views of the samples of profile position k.'''
+    offsets = RaggedOffsets(rag)
+    return (rag[rag.attrs['sensor']].values[offsets[k]:offsets[k + 1]], rag['depth'].values[offsets[k]:offsets[k + 1]])
+
+
+def RaggedSelect(rag, phase = None, pidcs = None):
+    '''
+    Subset a ragged profile array by phase ('rest', 'ascent' or 'descent') and / or by a list of
+    profile metadata row labels. Returns a new ragged profile array.
+    '''
+    keep = np.ones(rag.sizes['profile'], dtype=bool)
+    if phase is not None: keep &= rag['phase'].values == phase_codes[phase]
+    if pidcs is not None: keep &= np.isin(rag['profile_index'].values, pidcs)
+    offsets = RaggedOffsets(rag)
+    gather  = RaggedGather(offsets[:-1][keep], rag['rowSize'].values[keep])
+    return rag.isel(profile=np.flatnonzero(keep), obs=gather)
+
+
+def RaggedProfileStatistics(rag, key = None):
+    '''
+    Vectorized per-profile statistics of variable key (by default the sensor) ignoring NaNs:
+    Returns a Dataset on the 'profile' dimension with count, mean, std, min and max.
+    '''
+    if key is None: key = rag.attrs['sensor']
+    v      = rag[key].values.astype(float)
+    n      = rag.sizes['profile']
+    pid    = RaggedProfileIds(rag)
+    finite = np.isfinite(v)
+    count  = np.bincount(pid[finite], minlength=n)
+    total  = np.bincount(pid[finite], weights=v[finite], minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        var  = np.bincount(pid[finite], weights=(v[finite] - mean[pid[finite]])**2, minlength=n) / count
+
+    vmin, vmax = np.full(n, np.nan), np.full(n, np.nan)
+    nonempty   = rag['rowSize'].values > 0
+    starts     = RaggedOffsets(rag)[:-1][nonempty]
+    if len(starts):
+        vmin[nonempty] = np.fmin.reduceat(v, starts)
+        vmax[nonempty] = np.fmax.reduceat(v, starts)
+
+    return xr.Dataset({'count': ('profile', count), 'mean': ('profile', mean), 'std': ('profile', np.sqrt(var)),
+                       'min': ('profile', vmin), 'max': ('profile', vmax),
+                       'profile_index': rag['profile_index'], 'phase': rag['phase'], 'profile_time': rag['profile_time']})
+
+
+def RaggedPolyline(rag, key = None):
+    '''
+    Return (x, z): The sensor (or variable key) values and depths of all profiles as one
+    NaN-separated polyline; so that a whole bundle is drawn with a single plot() call.
+    '''
+    if key is None: key = rag.attrs['sensor']
+    breaks = RaggedOffsets(rag)[1:-1]
+    x = np.insert(rag[key].values.astype(float), breaks, np.nan)
+    z = np.insert(rag['depth'].values.astype(float), breaks, np.nan)
+    return x, z
+
+
+def WriteRaggedProfiles(rag, fnm):
+    '''Save a ragged profile array as NetCDF (CF contiguous ragged array representation).'''
+    rag.to_netcdf(fnm)
+    return True
+
+
+def ReadRaggedProfiles(fnm):
+    '''Load a ragged profile array written by WriteRaggedProfiles().'''
+    return xr.open_dataset(fnm).load()
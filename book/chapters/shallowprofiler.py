@@ -4,6 +4,10 @@
 #   - shallow profiler data access
 #   - shallow profiler sensor data dictionaries
 #   - shallow profiler specific sensor bespoke functions
+#
+# Core layer: imports only numpy, pandas and xarray (and the timeutil, oceanscience, coregister and data 
+#   modules) and prints nothing, so batch workers
+#   can use it without the plotting (charts.py) and widget layers.
 
 #############################
 #############################
@@ -13,23 +17,23 @@
 #############################
 #############################
 
-import os, sys, time, glob, warnings
+import os, sys, time, glob, warnings, hashlib
 from os.path import join as joindir
-from IPython.display import clear_output
-from matplotlib import pyplot as plt
-from matplotlib import colors as mplcolors
+from collections import OrderedDict
+from collections.abc import Mapping
 import numpy as np, pandas as pd, xarray as xr
 from numpy import datetime64 as dt64, timedelta64 as td64
 
+from timeutil import doy, dt64_from_doy, DayOfYear, DateFromDayOfYear, TimeOfDay, DayBounds, MonthBounds, DaySplit
+from oceanscience import SigmaTheta, Spiciness, PotentialTemperature, PressureFromDepth
+from coregister import Coregister
+from data import WriteAtomic
+
 warnings.filterwarnings('ignore')
 
-def doy(theDatetime): return 1 + int((theDatetime - dt64(str(theDatetime)[0:4] + '-01-01')) / td64(1, 'D'))
-def dt64_from_doy(year, doy): return dt64(str(year) + '-01-01') + td64(doy-1, 'D')
 def day_of_month_to_string(d): return str(d) if d > 9 else '0' + str(d)
 
 
-print('\nJupyter Notebook running Python {}'.format(sys.version_info[0]))
-
 
 #############################
 #############################
@@ -39,7 +43,7 @@ print('\nJupyter Notebook running Python {}'.format(sys.version_info[0]))
 #############################
 #############################
 
-def ReadProfileMetadata(fnm = './data/rca/profiles/osb/january2022.csv'):
+def ReadProfileMetadata(fnm = './data/rca/profiles/osb/january2022.csv', with_indices = False):
     """
     Profiles are saved in a CSV file as six events per row: Rest start, Rest end, Ascent start,
     Ascent end, Descent start, Descent end. Each event includes a time and depth. There is event
@@ -49,7 +53,16 @@ def ReadProfileMetadata(fnm = './data/rca/profiles/osb/january2022.csv'):
     the zero which is the sea surface.
     
     The profile source file path uses a default tied to Oregon Slope Base (OSB), January 2022.
+
+    A NetCDF (.nc) profile file written by data.ProfileMetadataWriter() (or converted from the CSV by
+    data.ConvertProfileCSV()) loads with native datetime64 columns and no parsing. For these the
+    event sample indices are included as columns 'r0i', 'r1i', ... when with_indices is True.
     """
+    if fnm.endswith('.nc'):
+        columns = ['r0t','r0z','r1t','r1z','a0t','a0z','a1t','a1z','d0t','d0z','d1t','d1z']
+        if with_indices: columns += ['r0i','r1i','a0i','a1i','d0i','d1i']
+        with xr.open_dataset(fnm) as ds: return pd.DataFrame({c: ds[c].values for c in columns})
+
     df = pd.read_csv(fnm, usecols=["1","2","4","5","7","8","10","11","13","14","16","17"])
     df.columns=['r0t','r0z','r1t','r1z','a0t','a0z','a1t','a1z','d0t','d0z','d1t','d1z']
     df['r0t'] = pd.to_datetime(df['r0t'])
@@ -62,7 +75,42 @@ def ReadProfileMetadata(fnm = './data/rca/profiles/osb/january2022.csv'):
 
 
 
-def GenerateTimeWindowIndices(profiles, date0, date1, time0, time1):
+# empirical UTC time-of-day windows for the day's two longer-duration profiles (ascent start)
+midnight_window = (td64( 7*60 + 10, 'm'), td64( 7*60 + 34, 'm'))     # 7:10 to 7:34
+noon_window     = (td64(20*60 + 30, 'm'), td64(20*60 + 54, 'm'))     # 20:30 to 20:54
+
+
+def ProfileIndex(profiles, key = 'a0t'):
+    '''
+    Build a profile index once from the profile metadata DataFrame for fast time window queries
+    (see ProfileIndexQuery()). The index is a dictionary: 't' profile start times (column key, 
+    by default ascent start) sorted as datetime64[ns]; 'tod' the matching UTC time-of-day offsets; 
+    'rows' the matching row labels of profiles.
+    '''
+    t     = profiles[key].values.astype('datetime64[ns]')
+    order = np.argsort(t, kind='stable')
+    t     = t[order]
+    return {'t': t, 'tod': TimeOfDay(t), 'rows': profiles.index.values[order]}
+
+
+def ProfileIndexQuery(pindex, date0, date1, time0 = td64(0, 'h'), time1 = td64(24, 'h'), when = None):
+    '''
+    Return an array of profile row labels for profiles that start within the time box: Days in
+    [date0, date1] inclusive and UTC time of day in [time0, time1] inclusive. If time0 > time1 the
+    time of day window wraps past midnight. when = 'midnight' or 'noon' replaces time0, time1 with
+    midnight_window or noon_window. pindex comes from ProfileIndex().
+    '''
+    if   when == 'midnight': time0, time1 = midnight_window
+    elif when == 'noon':     time0, time1 = noon_window
+    lo  = np.searchsorted(pindex['t'], dt64(date0, 'ns'), side='left')
+    hi  = np.searchsorted(pindex['t'], dt64(date1, 'ns') + td64(1, 'D'), side='right')
+    tod = pindex['tod'][lo:hi]
+    if time0 <= time1: keep = (tod >= time0) & (tod <= time1)
+    else:              keep = (tod >= time0) | (tod <= time1)
+    return pindex['rows'][lo:hi][keep]
+
+
+def GenerateTimeWindowIndices(profiles, date0, date1, time0, time1, pindex = None):
     '''
     In UTC: Define a time box from two bounding days and -- within a day -- 
     a bounding time interval. This function then produces a list of profile 
@@ -75,14 +123,10 @@ def GenerateTimeWindowIndices(profiles, date0, date1, time0, time1):
     date1
     time0       likewise inclusive [time0, time1] sense
     time1
+    pindex      optional ProfileIndex(profiles) built once and reused across calls
     '''
-    pidcs = []
-    for i in range(len(profiles)):
-        a0 = profiles["a0t"][i]
-        if a0 >= date0 and a0 <= date1 + td64(1, 'D'):
-            delta_t = a0 - dt64(a0.date())
-            if delta_t >= time0 and delta_t <= time1: pidcs.append(i)
-    return pidcs
+    if pindex is None: pindex = ProfileIndex(profiles)
+    return ProfileIndexQuery(pindex, date0, date1, time0, time1).tolist()
 
 
 #############################
@@ -105,8 +149,9 @@ def GetSensorTuple(s, f):
     Argument s is the sensor identifier string like 'temp'
     Argument f is the source filename like './../data/osb_ctd_jan22_temperature.nc' 
     '''
-    DA_sensor    = xr.open_dataset(f)[s]                # DataArray
-    DA_depth     = xr.open_dataset(f)['depth']          # DataArray
+    ds           = xr.open_dataset(f)                   # one open: lazily loaded Dataset
+    DA_sensor    = ds[s]                                # DataArray
+    DA_depth     = ds['depth']                          # DataArray
     range_lo     = ranges[s][0]                         # expected numerical range of this sensor data
     range_hi     = ranges[s][1]                         #   lo and high
     sensor_color = colors[s]                            #   default chart color for this sensor
@@ -114,6 +159,242 @@ def GetSensorTuple(s, f):
 
 
 
+def SensorFiles(data_file_root_path, site, sensors, month, year):
+    '''Return a dictionary sensor key > filename per AssembleShallowProfilerDataFilename()'''
+    return {s: AssembleShallowProfilerDataFilename(data_file_root_path, site, s, month, year) for s in sensors}
+
+
+class SensorRegistry(Mapping):
+    '''
+    A lazily loaded data dictionary: Maps sensor keys to files and behaves like the notebook data 
+    dictionary d of GetSensorTuple() 5-tuples (sensor DataArray, depth DataArray, range-lo, range-hi,
+    color). Nothing is opened until a sensor is first accessed; each file is opened once and the 
+    handle is shared by all sensors stored in that file. Data are read on first use of the values
+    (or are dask-backed when chunks is given, e.g. chunks = {'time': 86400}).
+
+    files     dictionary sensor key > filename (see SensorFiles()); the key is the data variable name
+    chunks    optional xr.open_dataset() chunks for dask-backed DataArrays
+    cache_dir folder for derived variable files; default: 'derived' next to the salinity file
+
+    The derived_variables keys (e.g. d['sigma_theta']) are available too when the registry has their
+    CTD inputs: computed once by DerivedDataset() and memoized to disk on first access. A membership
+    test (s in registry) opens and computes nothing. registry.derivable() lists them; iteration
+    covers the files only so that listing the registry computes nothing.
+
+    registry.info(s) gives the range, standard deviation, color and display name of sensor s.
+    '''
+    def __init__(self, files, chunks = None, cache_dir = None):
+        self.files     = dict(files)
+        self.chunks    = chunks
+        self.cache_dir = cache_dir
+        self.datasets  = {}                 # filename > open Dataset
+        self.tuples    = {}                 # sensor key > 5-tuple
+
+    def __getitem__(self, s):
+        if s not in self.tuples:
+            if s in self.files:                                       ds = self.dataset(self.files[s])
+            elif s in derived_variables and DerivedInputs(self.files): ds = DerivedDataset(self, s)
+            else: raise KeyError(s)
+            lo, hi = ranges.get(s, (None, None))
+            self.tuples[s] = (ds[s], ds['depth'], lo, hi, colors.get(s, 'black'))
+        return self.tuples[s]
+
+    def __contains__(self, s):
+        '''Membership without I/O: a file key, or a derived variable whose inputs the registry has'''
+        return s in self.files or (s in derived_variables and bool(DerivedInputs(self.files)))
+
+    def __iter__(self): return iter(self.files)
+
+    def __len__(self): return len(self.files)
+
+    def dataset(self, f):
+        '''Return the open Dataset for file f: opened on first request only'''
+        if f not in self.datasets: 
+            self.datasets[f] = xr.open_dataset(f) if self.chunks is None else xr.open_dataset(f, chunks=self.chunks)
+        return self.datasets[f]
+
+    def derivable(self):
+        '''List the derived_variables keys whose inputs this registry has'''
+        return list(derived_variables) if DerivedInputs(self.files) else []
+
+    def info(self, s):
+        '''Sensor s metadata from the ranges, standard_deviations, colors and sensor_names dictionaries'''
+        return {'range': ranges.get(s), 'standard_deviation': standard_deviations.get(s), 
+                'color': colors.get(s), 'name': sensor_names.get(s, s)}
+
+    def loaded(self):
+        '''List the sensor keys accessed so far'''
+        return list(self.tuples)
+
+    def close(self):
+        for ds in self.datasets.values(): ds.close()
+        self.datasets, self.tuples = {}, {}
+
+
+
+# Derived variables: key > formula f(salinity, temperature, pressure) of oceanscience.py, its version 
+#   and units. Increment the version when a formula changes: memoized results of older versions are
+#   then no longer found and are recomputed.
+derived_variables = {
+    'sigma_theta':           {'function': SigmaTheta,           'version': 1, 'units': 'kg m-3'},
+    'spiciness':             {'function': Spiciness,            'version': 1, 'units': 'kg m-3'},
+    'potential_temperature': {'function': PotentialTemperature, 'version': 1, 'units': 'deg C'},
+}
+
+# derived variable inputs: role > the sensor keys that can fill it, first found used. Without a
+#   pressure sensor, pressure comes from the salinity file depth (PressureFromDepth()).
+derived_inputs = {'salinity': ['salinity'], 'temperature': ['temp', 'temperature'], 'pressure': ['pressure']}
+
+
+def DerivedInputs(files):
+    '''Map derived variable input roles to sensor keys in files (a dictionary sensor > filename); {} if incomplete'''
+    roles = {r: next((k for k in keys if k in files), None) for r, keys in derived_inputs.items()}
+    if roles['pressure'] is None: del roles['pressure']
+    return roles if all(roles.values()) else {}
+
+
+def DerivedFilename(key, files, cache_dir = None):
+    '''
+    The memo file of derived variable key: Named for a hash of the key, the formula version and
+    the path, modification time and size of each input file. Any change to an input or to the
+    formula gives a new name, so a memo file found is always current.
+    '''
+    inputs = DerivedInputs(files)
+    fnms   = sorted(set(os.path.abspath(files[k]) for k in inputs.values()))
+    stamp  = [(f, os.stat(f).st_mtime_ns, os.stat(f).st_size) for f in fnms]
+    digest = hashlib.sha1(repr((key, derived_variables[key]['version'], stamp)).encode()).hexdigest()[:16]
+    if cache_dir is None: cache_dir = joindir(os.path.dirname(os.path.abspath(files[inputs['salinity']])), 'derived')
+    return joindir(cache_dir, key + '_' + digest + '.nc')
+
+
+def DerivedDataset(registry, key, chunk = 86400):
+    '''
+    The Dataset ('time', data variables key and 'depth') of derived variable key from the CTD
+    sensors of SensorRegistry registry: Loaded from the memo file (DerivedFilename()) if present.
+    Otherwise temperature and pressure are aligned (coregister.Coregister(), nearest sample) onto
+    the salinity times, the formula is evaluated chunk samples at a time and the result is written 
+    to the memo file; if that cannot be written the in-memory result is returned.
+    '''
+    spec    = derived_variables[key]
+    inputs  = DerivedInputs(registry.files)
+    memofnm = DerivedFilename(key, registry.files, registry.cache_dir)
+    if os.path.exists(memofnm): return registry.dataset(memofnm)
+
+    salinity = registry[inputs['salinity']]
+    sensors  = {r: registry[k][0] for r, k in inputs.items()}
+    sensors['depth'] = salinity[1]
+    aligned  = Coregister(sensors, 'salinity', 'nearest')
+    s, t     = aligned['salinity'].values, aligned['temperature'].values
+    p        = aligned['pressure'].values if 'pressure' in aligned else PressureFromDepth(aligned['depth'].values)
+    v        = np.empty(len(s))
+    for i0 in range(0, len(s), chunk): v[i0:i0 + chunk] = spec['function'](s[i0:i0 + chunk], t[i0:i0 + chunk], p[i0:i0 + chunk])
+
+    attrs = {'units': spec['units'], 'long_name': sensor_names.get(key, key), 'formula_version': spec['version'],
+             'inputs': ', '.join(registry.files[k] for k in inputs.values())}
+    ds = xr.Dataset({key: ('time', v, attrs), 'depth': ('time', aligned['depth'].values, salinity[1].attrs)},
+                    coords={'time': aligned['time'].values})
+    try: WriteAtomic(ds, memofnm)
+    except OSError: return ds
+    return registry.dataset(memofnm)
+
+
+
+# profile metadata time columns bounding each phase of a profile
+profile_phases = {'rest': ('r0t', 'r1t'), 'ascent': ('a0t', 'a1t'), 'descent': ('d0t', 'd1t')}
+
+# sensors charted on descent rather than ascent > leading samples to skip per profile: the first 
+#   descent value of pH and pCO2 is the last value of the prior profile
+descent_sensors = {'ph': 1, 'pco2': 1}
+
+
+def SensorPhase(s):
+    '''(phase, skip) for charting sensor s: descent_sensors on descent less their leading samples; else ascent'''
+    return ('descent', descent_sensors[s]) if s in descent_sensors else ('ascent', 0)
+
+
+def ProfileSegmentCache(profiles, max_segments = 4096, max_sensors = 8):
+    '''
+    Create a per-profile segment cache for one profile metadata DataFrame; used by ProfileSegment().
+    Sensor sample offsets for every profile are computed once per (sensor, phase); segments are
+    then zero-copy NumPy views. Cached segments are bounded by max_segments and cached sensors 
+    (each holding its full value and depth arrays) by max_sensors: least recently used goes first.
+    '''
+    bounds = {phase: (profiles[k0].values.astype('datetime64[ns]'), profiles[k1].values.astype('datetime64[ns]')) \
+              for phase, (k0, k1) in profile_phases.items()}
+    return {'rows': pd.Index(profiles.index), 'bounds': bounds, 'sensors': OrderedDict(), 'segments': OrderedDict(), 
+            'max_segments': max_segments, 'max_sensors': max_sensors}
+
+
+def ProfileSegment(cache, A, Az, pidx, phase = 'ascent'):
+    '''
+    Return (values, depths): NumPy views of DataArrays A (sensor) and Az (its depth) for profile 
+    row pidx and phase 'rest', 'ascent' or 'descent'. Same samples as A.sel(time=slice(t0, t1))
+    with t0, t1 from the profile table, without repeating the time search. cache comes from 
+    ProfileSegmentCache(). Segments are keyed (ProfileSegmentKey(A, Az), pidx, phase).
+    '''
+    entry, (i0, i1) = ProfileSegmentOffsets(cache, A, Az, phase)
+    key = (ProfileSegmentKey(A, Az), pidx, phase)
+    if key in cache['segments']:
+        cache['segments'].move_to_end(key)
+        return cache['segments'][key]
+
+    row = cache['rows'].get_loc(pidx)
+    segment = (entry['values'][i0[row]:i1[row]], entry['depths'][i0[row]:i1[row]])
+
+    cache['segments'][key] = segment
+    if len(cache['segments']) > cache['max_segments']: cache['segments'].popitem(last=False)
+    return segment
+
+
+def ProfileSegmentKey(A, Az):
+    '''
+    The cache key of sensor A with depth Az: the DataArray objects themselves (by id; the cache entry 
+    holds them so an id is never reused while cached), not the name. Two arrays named 'temperature'
+    (two sites, two months) are two entries.
+    '''
+    return (id(A), id(Az))
+
+
+def ProfileSegmentStamp(A, Az):
+    '''A cheap signature of the arrays behind a cache entry: shapes and first and last times'''
+    t = A['time'].values
+    return (A.shape, Az.shape) + ((t[0], t[-1]) if len(t) else ())
+
+
+def ProfileSegmentOffsets(cache, A, Az, phase = 'ascent'):
+    '''
+    Return (entry, (i0, i1)) for sensor A in a ProfileSegmentCache(): entry holds the sensor's 'values',
+    'depths' and 'time' arrays; i0, i1 are the sample offsets of phase for every profile table row.
+    An entry whose arrays have changed since it was made (ProfileSegmentStamp()) is rebuilt.
+    '''
+    sensor = ProfileSegmentKey(A, Az)
+    stamp  = ProfileSegmentStamp(A, Az)
+    entry  = cache['sensors'].get(sensor)
+    if entry is not None and (entry['A'] is not A or entry['Az'] is not Az or entry['stamp'] != stamp):
+        ProfileSegmentDrop(cache, sensor)
+        entry = None
+    if entry is None:
+        entry = cache['sensors'][sensor] = {'values': A.values, 'depths': Az.values, 
+                                            'time': A['time'].values.astype('datetime64[ns]'), 'offsets': {},
+                                            'A': A, 'Az': Az, 'stamp': stamp}
+        if len(cache['sensors']) > cache['max_sensors']: ProfileSegmentDrop(cache, next(iter(cache['sensors'])))
+    else: cache['sensors'].move_to_end(sensor)
+
+    # one vectorized search over all profile bounds for this phase: inclusive [t0, t1] as in sel()
+    if phase not in entry['offsets']:
+        t0, t1 = cache['bounds'][phase]
+        entry['offsets'][phase] = (np.searchsorted(entry['time'], t0, side='left'), 
+                                   np.searchsorted(entry['time'], t1, side='right'))
+    return entry, entry['offsets'][phase]
+
+
+def ProfileSegmentDrop(cache, sensor):
+    '''Remove a sensor (ProfileSegmentKey()) and its segments from a ProfileSegmentCache()'''
+    del cache['sensors'][sensor]
+    for k in [k for k in cache['segments'] if k[0] == sensor]: del cache['segments'][k]
+
+
+
 
 # A data dictionary called dd
 # dd = {}
@@ -220,7 +501,8 @@ ranges = {
 'do':(50.0, 300.),
 'par':(0.0, 300.),
 'ph':(7.6, 8.2),
-'up':(-0.4, 0.4),'east':(-0.4, 0.4),'north':(-0.4, 0.4)
+'up':(-0.4, 0.4),'east':(-0.4, 0.4),'north':(-0.4, 0.4),
+'sigma_theta':(24.3, 26.8),'spiciness':(-1.2, 0.2),'potential_temperature':(7, 11)
 }
 
 
@@ -235,7 +517,8 @@ standard_deviations = {
 'do':(0.0, 40.),
 'par':(0.0, 30.),
 'ph':(0., 0.2),
-'up':(0., 0.1),'east':(0, 0.1),'north':(0., 0.1)
+'up':(0., 0.1),'east':(0, 0.1),'north':(0., 0.1),
+'sigma_theta':(0., .3),'spiciness':(0., .1),'potential_temperature':(.0, .7)
 }
 
 
@@ -251,7 +534,8 @@ colors = {
 'do':'blue',
 'par':'red',
 'ph':'yellow',
-'up':'red','east':'green','north':'blue'
+'up':'red','east':'green','north':'blue',
+'sigma_theta':'xkcd:brick red','spiciness':'xkcd:burnt orange','potential_temperature':'red'
 }
 
 # Realign
@@ -272,7 +556,9 @@ sensor_names = {
 'do':'Dissolved Oxygen',
 'par':'Photosynthetically Available Radiation',
 'ph':'pH',
-'up':'Current: Vertical','east':'Current: East','north':'Current: North'
+'up':'Current: Vertical','east':'Current: East','north':'Current: North',
+'sigma_theta':'Potential Density Anomaly (kg m-3)','spiciness':'Spiciness (kg m-3)',
+'potential_temperature':'Potential Temperature (deg C)'
 }
 
 
@@ -285,35 +571,49 @@ sensor_names = {
 #############################
 
 
-def ReformatSpkirData(ds, output_fnm_base):
+# spkir source data variable > sensor name; [0] becomes [1]
+spkir_channels = OrderedDict([('412nm', 'spkir412nm'), ('443nm', 'spkir443nm'), ('490nm', 'spkir490nm'), 
+                              ('510nm', 'spkir510nm'), ('555nm', 'spkir555nm'), ('620nm', 'spkir620nm'), 
+                              ('683nm', 'spkir683nm')])
+
+
+def ReformatSpkirData(ds, output_fnm_base, multichannel = False):
     """
     From an un-differentiated spkir.nc source file we have Dataset ds.
     This will be written as 7 sensor files where sensor name is spkir412nm etc.
     Already using non-duplicated 'time'. Sensor names will have spkir pre-pended.
+
+    The duplicate-time check runs once (data.TimeIndex()); each channel is then a shallow view
+    of the de-duplicated Dataset sharing its time and z, so there is one read and no copies.
+    With multichannel = True a single file output_fnm_base + 'spkir.nc' is written instead:
+    variable 'spkir' with dimensions (time, wavelength) plus z. (The 7 files are written one 
+    after another: the netCDF / HDF5 library does not support concurrent writes from threads.)
+    Returns the list of files written.
     """
-    ds_data_vars = [i for i in ds.data_vars]
-    ds_attrs     = [i for i in ds.attrs]
-    dvars = [['412nm', 'spkir412nm'],      # [0] becomes [1]
-             ['443nm', 'spkir443nm'], ['490nm', 'spkir490nm'], ['510nm', 'spkir510nm'],
-             ['555nm', 'spkir555nm'], ['620nm', 'spkir620nm'], ['683nm', 'spkir683nm']]
-
-    for dv in dvars:                 # loops over data variables to modify 
-        local_ds = ds.copy()         #   the local_ds copy of the passed full dataset
-        for ds_dv in ds_data_vars:
-            if not ds_dv == dv[0] and not ds_dv == 'z':
-                local_ds = local_ds.drop(ds_dv)
-            elif ds_dv == dv[0]:
-                local_ds = local_ds.rename({ds_dv:dv[1]})
-        for key in ds_attrs: 
-            if not key == 'units': local_ds.attrs.pop(key)
-
-        # double check: eliminate duplicated time entries
-        _, keeper_index = np.unique(local_ds['time'], return_index=True)
-        local_ds = local_ds.isel(time=keeper_index)
-        
-        write_fnm = output_fnm_base + dv[1] + '.nc'
+    from data import TimeIndex
+
+    # double check: eliminate duplicated time entries (once for all channels)
+    ds    = ds.isel(time=TimeIndex(ds['time'].values))
+    attrs = {k: v for k, v in ds.attrs.items() if k == 'units'}
+    z     = ['z'] if 'z' in ds.data_vars else []
+    dvars = [(dv, name) for dv, name in spkir_channels.items() if dv in ds.data_vars]
+
+    if multichannel:
+        spkir = xr.concat([ds[dv] for dv, _ in dvars], dim='wavelength')
+        spkir = spkir.assign_coords(wavelength=[int(dv[:-2]) for dv, _ in dvars]).transpose('time', 'wavelength')
+        local_ds = xr.Dataset({'spkir': spkir, **{k: ds[k] for k in z}}, attrs=attrs)
+        write_fnm = output_fnm_base + 'spkir.nc'
+        local_ds.to_netcdf(write_fnm)
+        return [write_fnm]
+
+    written = []
+    for dv, name in dvars:                                  # loops over data variables to write
+        local_ds = ds[[dv] + z].rename({dv: name})        #   shallow: shares time, z and the channel data
+        local_ds.attrs = attrs
+        write_fnm = output_fnm_base + name + '.nc'
         local_ds.to_netcdf(write_fnm)
-    return
+        written.append(write_fnm)
+    return written
 
 
 
@@ -1,3 +1,9 @@
+import os, sys, time, glob, warnings
+import numpy as np, pandas as pd, xarray as xr
+from numpy import datetime64 as dt64, timedelta64 as td64
+
+from data import NormalizeTime, WriteAtomic
+
 
 # global sensor range parameters for charting data: based on osb shallow profiler data
 
@@ -80,6 +86,12 @@ labelOA28 = 'Optical Absorption ch 28'
 # Inspect curtain plot 'availability' using depth
 # c.depth.plot()
 # 
+###########################
+# The above as a chunked, out-of-core pipeline
+###########################
+# ConcatenateOptaa(sorted(glob.glob('../../data/rca/spectrophotometer/optaa*.nc')), '../../data/rca/spectrophotometer/optaa.nc')
+# s = ReadOptaa('../../data/rca/spectrophotometer/optaa.nc', channels=[28, 56], t0='2021-03-13', t1='2021-03-16')
+#
 ###############################
 # Scope of a single source file
 ###############################
@@ -110,3 +122,54 @@ labelOA28 = 'Optical Absorption ch 28'
 #   as one-year-duration CSV files in the Profiles subfolder; are read into a Pandas 
 #   Dataframe. Columns correspond to ascent start time and so on, as noted in the code.
 
+
+
+# OPTAA data variables retained, renamed to shortened names
+optaa_keep = {'optical_absorption':'oa', 'beam_attenuation':'ba'}
+
+
+def OptaaPreprocess(ds):
+    '''
+    Applied to each OPTAA source file as it is (lazily) opened: Promote 'time' to the dimension in
+    place of 'obs'; retain only optical absorption, beam attenuation and depth; rename per optaa_keep.
+    '''
+    if 'obs' in ds.dims: ds = ds.swap_dims({'obs':'time'})
+    if 'depth' in ds.coords: ds = ds.reset_coords('depth')
+    keep = [v for v in list(optaa_keep) + ['depth'] if v in ds.data_vars]
+    return ds[keep].reset_coords(drop=True).rename({k: v for k, v in optaa_keep.items() if k in keep})
+
+
+def ConcatenateOptaa(fnms, outfnm, t0 = None, t1 = None, time_chunk = 50000, wavelength_chunk = 8):
+    '''
+    Out-of-core version of the concatenation above: Open the (e.g. monthly) OPTAA source files fnms 
+    as one lazy multi-file Dataset, time-ordered with duplicate times removed and optionally subset 
+    to [t0, t1]. Write a compressed NetCDF4 store chunked (time_chunk x wavelength_chunk) so that 
+    channel and time subsets can later be read without loading the whole record (ReadOptaa()).
+    Data move through memory a chunk at a time (requires dask): Memory use does not grow with
+    the number of source files. Returns the output filename.
+    '''
+    ds = xr.open_mfdataset(sorted(fnms), preprocess=OptaaPreprocess, chunks={'obs': time_chunk},
+                           combine='nested', concat_dim='time', data_vars='minimal', coords='minimal', compat='override')
+    ds = NormalizeTime(ds, t0, t1)
+    ds = ds.chunk({d: {'time': time_chunk, 'wavelength': wavelength_chunk}.get(d, -1) for d in ds.dims})
+
+    encoding = {}
+    for v in ds.data_vars:
+        chunksizes = tuple(min({'time': time_chunk, 'wavelength': wavelength_chunk}.get(d, ds.sizes[d]), ds.sizes[d]) \
+                           for d in ds[v].dims)
+        encoding[v] = {'zlib': True, 'complevel': 1, 'chunksizes': chunksizes}
+    return WriteAtomic(ds, outfnm, encoding)
+
+
+def ReadOptaa(fnm, channels = None, t0 = None, t1 = None):
+    '''
+    Open a ConcatenateOptaa() store lazily and subset it by wavelength channel index list (e.g. 
+    [28, 56]) and time [t0, t1]. Only the chunks overlapping the subset are read, on .load() or 
+    first use of the values.
+    '''
+    ds = xr.open_dataset(fnm)
+    if channels is not None: ds = ds.isel(wavelength=channels)
+    if t0 is not None or t1 is not None: 
+        ds = ds.sel(time=slice(dt64(t0) if t0 is not None else None, dt64(t1) if t1 is not None else None))
+    return ds
+
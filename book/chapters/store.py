@@ -0,0 +1,157 @@
+# store.py module contents
+#   - a per-site sensor store: one chunked, compressed NetCDF4 file holding all of a site's sensors
+#     across any number of months, in place of one file per (site, sensor, month, year)
+#   - conversion from the monthly files (AssembleShallowProfilerDataFilename() layout); appends only
+#     what is new, so a store grows month by month
+#   - time range queries that read only the day chunks they overlap
+#
+# Layout: One group per sensor (sensors differ in sample rate, so each has its own unlimited time
+#   dimension) with variables 'time', the sensor and 'depth', chunked by one day of samples and zlib
+#   compressed. Each group also holds a day index, 'day_start' and 'day_offset': the first sample of
+#   every day present. A query looks its bounds up in the index and reads only the samples between;
+#   the time variable itself is never read in full. The root group attributes list the sensors and
+#   each group's attributes give its time extent and sample count: All metadata sits in the one file
+#   header (consolidated) and is read on open.
+
+import os, sys, time, glob, warnings, re
+import numpy as np, pandas as pd, xarray as xr, netCDF4
+from numpy import datetime64 as dt64, timedelta64 as td64
+
+from shallowprofiler import ranges, colors
+from timeutil import Days, DaySplit
+from data import DayIndexForFile
+
+warnings.filterwarnings('ignore')
+
+time_units = 'nanoseconds since 1970-01-01T00:00:00'
+
+
+def SiteFiles(root, site, sensors = None):
+    '''
+    The monthly files root/site/<sensor>_<mon>_<yyyy>.nc present: A dictionary sensor > filenames in
+    time order. sensors restricts the sensors (default all found).
+    '''
+    found = {}
+    for fnm in glob.glob(os.path.join(root, site, '*_*_*.nc')):
+        m = re.fullmatch(r'(.+)_([a-z]{3})_(\d{4})\.nc', os.path.basename(fnm))
+        if m is None or (sensors is not None and m.group(1) not in sensors): continue
+        found.setdefault(m.group(1), []).append((pd.to_datetime(m.group(2) + ' ' + m.group(3), format='%b %Y'), fnm))
+    return {s: [fnm for _, fnm in sorted(found[s])] for s in sorted(found)}
+
+
+def StoreFilename(root, site):
+    '''The store of site under folder root: root/site.nc'''
+    return os.path.join(root, site + '.nc')
+
+
+def StoreGroup(nc, sensor, variables, samples_per_day):
+    '''Create the group of sensor in open netCDF4 Dataset nc: variables is a dictionary name > (dtype, attrs)'''
+    g = nc.createGroup(sensor)
+    g.createDimension('time', None)
+    g.createDimension('day', None)
+    chunk = max(int(samples_per_day), 1)
+    g.createVariable('time', 'i8', ('time',), zlib=True, complevel=1, chunksizes=(chunk,)).setncatts({'units': time_units})
+    for k, (dtype, attrs) in variables.items():
+        v = g.createVariable(k, dtype, ('time',), zlib=True, complevel=1, shuffle=True, chunksizes=(chunk,))
+        v.setncatts({a: x for a, x in attrs.items() if a != '_FillValue'})
+    g.createVariable('day_start', 'i8', ('day',), chunksizes=(1024,)).setncatts({'units': time_units})
+    g.createVariable('day_offset', 'i8', ('day',), chunksizes=(1024,))
+    g.setncatts({'samples': 0, 'time_start': '', 'time_end': ''})
+    return g
+
+
+def WriteSiteStore(storefnm, files, verbose = False):
+    '''
+    Convert monthly sensor files into the store storefnm (created if need be): files is a dictionary
+    sensor > filenames (SiteFiles()). Each file is copied a day at a time (DayIndexForFile()) so memory
+    is bounded by one day of one sensor. Samples no later than the last one already stored for that
+    sensor are skipped: Converting again, or adding the next month, appends only new data. Returns
+    a dictionary sensor > number of samples appended.
+    '''
+    appended = {}
+    with netCDF4.Dataset(storefnm, 'a' if os.path.exists(storefnm) else 'w') as nc:
+        nc.set_auto_mask(False)
+        for sensor, fnms in files.items():
+            appended[sensor] = 0
+            for fnm in fnms:
+                starts, offsets = DayIndexForFile(fnm)
+                with xr.open_dataset(fnm) as ds:
+                    names = [sensor] + [k for k in ds.data_vars if k != sensor]
+                    if sensor not in nc.groups:
+                        counts  = np.diff(offsets)
+                        per_day = counts.max() if len(counts) else 1
+                        StoreGroup(nc, sensor, {k: (ds[k].dtype, ds[k].attrs) for k in names}, per_day)
+                    g = nc.groups[sensor]
+                    for k in range(len(starts)):
+                        if offsets[k] == offsets[k + 1]: continue
+                        day = ds.isel(time=slice(offsets[k], offsets[k + 1]))
+                        appended[sensor] += StoreAppend(g, day['time'].values, {n: day[n].values for n in names})
+                if verbose: print(fnm + ' > ' + storefnm + ' group ' + sensor)
+        nc.setncatts({'sensors': ' '.join(sorted(nc.groups)), 'Conventions': 'CF-1.8'})
+    return appended
+
+
+def StoreAppend(g, t, values):
+    '''Append samples (times t, dictionary variable > values) to store group g: Returns the number appended'''
+    t = np.asarray(t, dtype='datetime64[ns]').astype(np.int64)
+    n = len(g.dimensions['time'])
+    if n:
+        keep = t > g['time'][n - 1]
+        t, values = t[keep], {k: v[keep] for k, v in values.items()}
+    if not len(t): return 0
+    g['time'][n:n + len(t)] = t
+    for k, v in values.items(): g[k][n:n + len(t)] = v
+
+    days, offsets = DaySplit(t.astype('datetime64[ns]'))
+    starts, nd = days.astype('datetime64[ns]').astype(np.int64), len(g.dimensions['day'])
+    if nd and starts[0] == g['day_start'][nd - 1]: starts, offsets = starts[1:], offsets[1:-1]
+    else: offsets = offsets[:-1]
+    g['day_start'][nd:nd + len(starts)] = starts
+    g['day_offset'][nd:nd + len(starts)] = offsets + n
+
+    first = g['time'][0]
+    g.setncatts({'samples': n + len(t), 'time_start': str(np.int64(first).astype('datetime64[ns]')),
+                 'time_end': str(t[-1].astype('datetime64[ns]'))})
+    return len(t)
+
+
+def StoreInfo(storefnm):
+    '''The store contents from its metadata alone: A DataFrame indexed by sensor with samples, time_start and time_end'''
+    with netCDF4.Dataset(storefnm) as nc:
+        return pd.DataFrame([{'sensor': s, 'samples': int(nc.groups[s].getncattr('samples')),
+                              'time_start': dt64(nc.groups[s].getncattr('time_start')),
+                              'time_end': dt64(nc.groups[s].getncattr('time_end'))} for s in nc.groups]).set_index('sensor')
+
+
+def ReadSiteStore(storefnm, sensor, t0 = None, t1 = None):
+    '''
+    Sensor data for times [t0, t1] (inclusive as in sel(); None for open ended) from store storefnm:
+    A Dataset on 'time' with the sensor and 'depth' variables, loaded. The day index locates the
+    samples, so only the chunks of the days overlapping [t0, t1] are read and decompressed. (Read
+    with netCDF4 rather than xr.open_dataset(), which would load the whole time coordinate.)
+    '''
+    with netCDF4.Dataset(storefnm) as nc:
+        g = nc.groups[sensor]
+        g.set_auto_mask(False)
+        n       = len(g.dimensions['time'])
+        days    = g['day_start'][:].astype('datetime64[ns]')
+        offsets = np.append(g['day_offset'][:], n)
+        i0 = 0 if t0 is None else offsets[np.searchsorted(days, dt64(Days(t0), 'ns'), side='left')]
+        i1 = n if t1 is None else offsets[np.searchsorted(days, dt64(Days(t1), 'ns'), side='right')]
+        names = [k for k in g.variables if g[k].dimensions == ('time',) and k != 'time']
+        out = xr.Dataset({k: ('time', g[k][i0:i1], {a: g[k].getncattr(a) for a in g[k].ncattrs()}) for k in names},
+                         coords={'time': g['time'][i0:i1].astype('datetime64[ns]')})
+    return out.sel(time=slice(t0, t1))
+
+
+def StoreSensors(storefnm, sensors, t0 = None, t1 = None):
+    '''
+    A notebook data dictionary d (sensor > GetSensorTuple() 5-tuple) for [t0, t1] from the store: The
+    month-spanning counterpart of SensorFiles() + GetSensorTuple() for the chart functions.
+    '''
+    d = {}
+    for s in sensors:
+        ds = ReadSiteStore(storefnm, s, t0, t1)
+        lo, hi = ranges.get(s, (None, None))
+        d[s] = (ds[s], ds['depth'], lo, hi, colors.get(s, 'black'))
+    return d
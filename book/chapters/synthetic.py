@@ -0,0 +1,189 @@
+# synthetic.py module contents
+#   - a synthetic shallow profiler: the daily schedule of nine profiles with slower midnight and noon profiles
+#   - depth and sensor values at any sample rate (spkir as the undifferentiated instrument Dataset too);
+#     the true profile metadata for checking profile detection
+#   - NetCDF files in the ReformatDataFile() layout, one per sensor per month, for scale testing
+#
+# The schedule: Every 160 minutes an ascent starts; the first of the day at 02:00 UTC. The ascents that
+#   start in shallowprofiler midnight_window and noon_window (07:20 and 20:40) rise and fall more slowly.
+#   Otherwise the profiler rests at the bottom of its range. Nine 160 minute slots make one day so the
+#   schedule repeats exactly each day.
+
+import os, sys, time, glob, warnings
+import numpy as np, pandas as pd, xarray as xr
+from numpy import datetime64 as dt64, timedelta64 as td64
+
+from shallowprofiler import sp_data_ranges, ranges, midnight_window, noon_window, spkir_channels, \
+                            AssembleShallowProfilerDataFilename
+from data import MonthChunks, ProfileMetadataWriter
+from timeutil import TimeOfDay, DayOfYear, MonthIndex, Year
+
+warnings.filterwarnings('ignore')
+
+synthetic_parameters = {
+    'first_ascent':      td64(2*60, 'm'),     # time of day (UTC) of the first ascent start
+    'slot':              td64(160, 'm'),      # ascent start to ascent start
+    'rest_depth':        -192.,               # m, negative down
+    'top_depth':         -12.,
+    'ascent_rate':       3.,                  # m / minute
+    'descent_rate':      4.,
+    'slow_ascent_rate':  2.5,                # midnight and noon profiles
+    'slow_descent_rate': 3.,
+    'noise':             0.05,                # m, depth noise standard deviation
+}
+
+# sensor keys written by default: sp_data_ranges keys (sp_sensorkeys) less time and pressure
+synthetic_sensors = [k for k in sp_data_ranges if k not in ('time', 'pressure')]
+
+month_names = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+
+def ProfileSchedule(params = synthetic_parameters):
+    '''
+    The daily schedule as a DataFrame, one row per profile slot: ascent start time of day 'a0',
+    ascent end / descent start 'a1', descent end 'd1' (time of day offsets; may pass 24 hours)
+    and 'slow' (True for the midnight and noon profiles).
+    '''
+    rows = []
+    for k in range(int(td64(1, 'D') / params['slot'])):
+        a0   = params['first_ascent'] + k*params['slot']
+        slow = bool(midnight_window[0] <= a0 <= midnight_window[1] or noon_window[0] <= a0 <= noon_window[1])
+        span = params['top_depth'] - params['rest_depth']
+        up   = span / (params['slow_ascent_rate'] if slow else params['ascent_rate'])
+        down = span / (params['slow_descent_rate'] if slow else params['descent_rate'])
+        a1   = a0 + td64(int(round(up*60)), 's')
+        rows.append({'a0': a0, 'a1': a1, 'd1': a1 + td64(int(round(down*60)), 's'), 'slow': slow})
+    return pd.DataFrame(rows)
+
+
+def SyntheticDepth(t, params = synthetic_parameters, schedule = None):
+    '''
+    Noise-free profiler depth (m, negative down) at datetime64 times t: One np.interp() on the
+    time of day against the daily schedule knots (rest, top, rest per profile slot).
+    '''
+    if schedule is None: schedule = ProfileSchedule(params)
+    lo, hi = params['rest_depth'], params['top_depth']
+    knots, depths = [], []
+    for shift in (-1, 0, 1):                                    # the day before and after cover wrap-around
+        for _, row in schedule.iterrows():
+            knots  += [(row[k] + shift*td64(1, 'D')) / td64(1, 's') for k in ('a0', 'a1', 'd1')]
+            depths += [lo, hi, lo]
+    return np.interp(TimeOfDay(t) / td64(1, 's'), knots, depths)
+
+
+def SyntheticProfiles(date0, date1, params = synthetic_parameters, rate = 1./60):
+    '''
+    True profile metadata for [date0, date1): A DataFrame with the ReadProfileMetadata() columns
+    r0t, r0z, ... d1z plus sample indices r0i, ... d1i into a depth record sampled at rate samples
+    per second from date0. Row i rest starts (r0) at the end of descent i - 1 (at the latest
+    date0).
+    '''
+    schedule = ProfileSchedule(params)
+    days = np.arange(dt64(date0, 'D') - 1, dt64(date1, 'D') + 1).astype('datetime64[ns]')
+    a0 = (days[:, None] + schedule['a0'].values.astype('timedelta64[ns]')[None, :]).ravel()
+    a1 = (days[:, None] + schedule['a1'].values.astype('timedelta64[ns]')[None, :]).ravel()
+    d1 = (days[:, None] + schedule['d1'].values.astype('timedelta64[ns]')[None, :]).ravel()
+    r0 = np.maximum(np.concatenate(([a0[0]], d1[:-1])), dt64(date0, 'ns'))
+    keep = (a0 >= dt64(date0, 'ns')) & (d1 < dt64(date1, 'ns'))
+    r0, a0, a1, d1 = r0[keep], a0[keep], a1[keep], d1[keep]
+
+    lo, hi = params['rest_depth'], params['top_depth']
+    events = {'r0': (r0, lo), 'r1': (a0, lo), 'a0': (a0, lo), 'a1': (a1, hi), 'd0': (a1, hi), 'd1': (d1, lo)}
+    df = pd.DataFrame()
+    for e, (t, z) in events.items():
+        df[e + 't'] = t
+        df[e + 'z'] = np.full(len(t), z)
+    for e, (t, z) in events.items():
+        df[e + 'i'] = np.round((t - dt64(date0, 'ns')) / td64(1, 's') * rate).astype(np.int64)
+    return df
+
+
+def SyntheticSensor(key, t, z, seed = 0):
+    '''
+    Values of sensor key at times t and depths z: A depth profile across the expected range of
+    key (sp_data_ranges, else ranges) with a seasonal shift and noise. Light (par, si / spkir
+    channels) decays with depth and follows the sun (local noon near 20:20 UTC).
+    '''
+    lo, hi = sp_data_ranges.get(key, ranges.get(key, (0., 1.)))
+    z   = np.asarray(z, dtype=float)
+    rng = np.random.default_rng(seed)               # an int or a sequence of ints
+    surface = 0.5 + 0.4*np.tanh((z + 60.)/25.)                 # 0.1 deep to 0.9 at the surface
+    if key in ('par',) or key.startswith('si') or key.startswith('spkir'):
+        hours = TimeOfDay(t) / td64(1, 'h')
+        shape = np.maximum(np.cos((hours - 20.33)/24.*2*np.pi), 0.)*np.exp(z/25.)
+    elif key in ('density', 'salinity', 'nitrate', 'nitratedark', 'pco2'): shape = 1. - surface
+    elif key == 'chlora':                           shape = 0.1 + 0.8*np.exp(-((z + 40.)/15.)**2)
+    elif key in ('east', 'north', 'up'):            shape = np.full(len(z), 0.5)
+    else:                                           shape = surface
+    season = 0.05*np.sin(2*np.pi*(DayOfYear(t) - 1)/365.25)
+    noise  = rng.normal(0., 0.01, len(z))
+    return lo + (hi - lo)*(shape + season + noise)
+
+
+def SyntheticDataset(keys, t0, t1, rate = 1., params = synthetic_parameters, seed = 0):
+    '''
+    A reformatted (ReformatDataFile() output) style Dataset over [t0, t1): Dimension 'time' at rate
+    samples per second; data variables 'depth' and one per sensor key. float32 values, computed a
+    day of samples at a time so that float64 temporaries stay small at high rates.
+    '''
+    t0, t1   = dt64(t0, 'ns'), dt64(t1, 'ns')
+    step     = td64(int(round(1e9/rate)), 'ns')
+    t        = np.arange(t0, t1, step)
+    schedule = ProfileSchedule(params)
+    block    = max(int(86400*rate), 1)
+    out      = {k: np.empty(len(t), dtype=np.float32) for k in ['depth'] + list(keys)}
+    for b, i0 in enumerate(range(0, len(t), block)):
+        tb = t[i0:i0 + block]
+        z  = SyntheticDepth(tb, params, schedule) + np.random.default_rng((seed, b)).normal(0., params['noise'], len(tb))
+        out['depth'][i0:i0 + block] = z
+        for k, key in enumerate(keys): out[key][i0:i0 + block] = SyntheticSensor(key, tb, z, (seed, b, k + 1))
+    return xr.Dataset({k: ('time', v) for k, v in out.items()}, coords={'time': t})
+
+
+def SyntheticSpkirDataset(t0, t1, rate = 1., params = synthetic_parameters, seed = 0):
+    '''
+    An undifferentiated spkir instrument Dataset over [t0, t1) as ReformatSpkirData() expects: One 
+    variable per channel (the spkir_channels keys, '412nm' ...) plus depth as 'z'.
+    '''
+    ds = SyntheticDataset(list(spkir_channels.values()), t0, t1, rate, params, seed)
+    ds = ds.rename({**{v: k for k, v in spkir_channels.items()}, 'depth': 'z'})
+    ds.attrs['units'] = 'uW cm-2 nm-1'
+    return ds
+
+
+def WriteSyntheticData(root, date0, date1, site = 'osb', sensors = None, rates = None, \
+                       params = synthetic_parameters, seed = 0, verbose = False):
+    '''
+    Write synthetic shallow profiler data for [date0, date1) under folder root, one month at a time
+    so that memory is bounded by one month of one sensor however long the time range:
+
+      root/site/<sensor>_<mon>_<yyyy>.nc    per AssembleShallowProfilerDataFilename(); variables
+                                            'depth' and the sensor; e.g. osb/salinity_jan_2022.nc
+      root/site/depth_<mon>_<yyyy>.nc       depth alone at 1 sample per minute (ProfileGenerator())
+      root/site/profiles_<mon>_<yyyy>.nc    the true profile metadata (ReadProfileMetadata())
+
+    sensors defaults to synthetic_sensors; rates is a dictionary sensor > samples per second
+    (default 1). Returns a dictionary sensor (or 'depth', 'profiles') > list of files written.
+    '''
+    if sensors is None: sensors = synthetic_sensors
+    if rates is None: rates = {}
+    os.makedirs(os.path.join(root, site), exist_ok=True)
+    written = {k: [] for k in ['depth', 'profiles'] + list(sensors)}
+
+    for k, (t0, t1) in enumerate(MonthChunks(date0, date1)):
+        month = month_names[MonthIndex(t0)]
+        year  = str(Year(t0))
+        fnm   = lambda s: AssembleShallowProfilerDataFilename(root, site, s, month, year)
+
+        ds = SyntheticDataset([], t0, t1, 1./60, params, seed + 1000*k)
+        ds.to_netcdf(fnm('depth')); written['depth'].append(fnm('depth'))
+
+        truth = SyntheticProfiles(t0, t1, params)
+        events = [list(zip(truth[e + 'i'], truth[e + 't'], truth[e + 'z'])) for e in ('a0', 'a1', 'd0', 'd1', 'r0', 'r1')]
+        ProfileMetadataWriter(fnm('profiles'), *events); written['profiles'].append(fnm('profiles'))
+
+        for j, s in enumerate(sensors):
+            ds = SyntheticDataset([s], t0, t1, rates.get(s, 1.), params, seed + 1000*k + j + 1)
+            ds.to_netcdf(fnm(s)); written[s].append(fnm(s))
+            if verbose: print(fnm(s) + ' ' + str(ds.sizes['time']) + ' samples')
+    return written
@@ -0,0 +1,104 @@
+# timeutil.py module contents
+#   - vectorized datetime64 helpers: day of year, day and month boundaries, time of day, per-day splits
+#   - per-day (or hourly) sample offset indices and reductions over them
+#
+# Everything works on whole datetime64 arrays (or single values) with integer arithmetic on the
+#   datetime64[D], [M] and [Y] casts: No string formatting and re-parsing per value. A single value
+#   in gives a single value out.
+
+import numpy as np
+from numpy import datetime64 as dt64, timedelta64 as td64
+
+
+def Scalar(x):
+    '''Unwrap a 0-dimensional array result to a NumPy scalar; arrays pass through'''
+    return x[()] if isinstance(x, np.ndarray) and x.ndim == 0 else x
+
+
+def Days(t):
+    '''datetime64 times t truncated to their day (datetime64[D])'''
+    return Scalar(np.asarray(t, dtype='datetime64[ns]').astype('datetime64[D]'))
+
+
+def DayOfYear(t):
+    '''Day of year of datetime64 times t: 1 for January 1'''
+    d = np.asarray(Days(t))
+    return Scalar((d - d.astype('datetime64[Y]')).astype(np.int64) + 1)
+
+
+def DateFromDayOfYear(year, doy):
+    '''datetime64[D] date of day of year doy (1 for January 1) in year: both may be arrays'''
+    years = (np.asarray(year, dtype=np.int64) - 1970).astype('datetime64[Y]')
+    return Scalar(years.astype('datetime64[D]') + (np.asarray(doy, dtype=np.int64) - 1))
+
+
+def TimeOfDay(t):
+    '''UTC time of day of datetime64 times t as timedelta64[ns] offsets from the start of the day'''
+    t = np.asarray(t, dtype='datetime64[ns]')
+    return Scalar(t - t.astype('datetime64[D]'))
+
+
+def DayBounds(date0, n_days = 1):
+    '''(starts, ends) of n_days consecutive days from the day of date0: datetime64[ns], ends exclusive'''
+    starts = (dt64(date0, 'D') + np.arange(n_days)).astype('datetime64[ns]')
+    return starts, starts + td64(1, 'D')
+
+
+def MonthBounds(t):
+    '''(start, end) datetime64[ns] of the calendar month(s) containing datetime64 times t; end exclusive'''
+    m = np.asarray(t, dtype='datetime64[ns]').astype('datetime64[M]')
+    return Scalar(m.astype('datetime64[ns]')), Scalar((m + 1).astype('datetime64[ns]'))
+
+
+def MonthIndex(t):
+    '''Calendar month of datetime64 times t: 0 for January ... 11 for December'''
+    return Scalar(np.asarray(t, dtype='datetime64[ns]').astype('datetime64[M]').astype(np.int64) % 12)
+
+
+def Year(t):
+    '''Calendar year of datetime64 times t as integers'''
+    return Scalar(np.asarray(t, dtype='datetime64[ns]').astype('datetime64[Y]').astype(np.int64) + 1970)
+
+
+def DaySplit(t):
+    '''
+    Split sorted datetime64 times t by day in one pass: Returns (days, offsets) where days are the
+    distinct datetime64[D] days present and the samples of days[k] are t[offsets[k]:offsets[k + 1]].
+    Use the same offsets to slice any array aligned with t (np.split(v, offsets[1:-1]) for a list).
+    '''
+    d       = np.asarray(Days(t))
+    change  = np.flatnonzero(d[1:] != d[:-1]) + 1
+    offsets = np.concatenate(([0], change, [len(d)])).astype(np.int64)
+    return d[offsets[:-1]], offsets
+
+
+def DayIndex(t, step = td64(1, 'D')):
+    '''
+    Sample offsets at every period boundary for sorted datetime64 times t: One searchsorted over
+    the boundaries from the start of the first day to past the last sample. Returns (starts,
+    offsets): the samples of period k (starting starts[k]) are t[offsets[k]:offsets[k + 1]]; empty
+    periods have offsets[k] == offsets[k + 1]. step is a day or (for hourly rows) a divisor of it.
+    '''
+    t = np.asarray(t, dtype='datetime64[ns]')
+    if not len(t): return np.zeros(0, dtype='datetime64[ns]'), np.zeros(1, dtype=np.int64)
+    step   = td64(step, 'ns')
+    first  = t[0].astype('datetime64[D]').astype('datetime64[ns]')
+    n      = int((t[-1] - first) // step) + 1
+    starts = first + np.arange(n)*step
+    return starts, np.searchsorted(t, np.append(starts, starts[-1] + step), side='left').astype(np.int64)
+
+
+def DayReduce(v, offsets, reduce = np.fmax):
+    '''
+    Per-period reduction of array v (aligned with the times of a DayIndex()) with a ufunc such as
+    np.fmax, np.fmin or np.add: One reduceat over the offsets. Empty periods give NaN.
+    '''
+    v      = np.asarray(v, dtype=float)
+    counts = np.diff(offsets)
+    out    = np.full(len(counts), np.nan)
+    if counts.any(): out[counts > 0] = reduce.reduceat(v, offsets[:-1][counts > 0])
+    return out
+
+
+# the names used by the chapter notebooks
+doy, dt64_from_doy = DayOfYear, DateFromDayOfYear